@@ -0,0 +1,74 @@
+# bench_body_compression.py
+"""Measure how page/article bodies compress with each body_codec option.
+
+Usage: python bench_body_compression.py [shop_domain] [rounds]
+
+With a shop_domain the stored pages and articles of that shop are used (needs DATABASE_URL);
+without one a synthetic set of theme-like pages is generated. For zlib and, if the zstandard
+package is installed, zstd, each with and without a dictionary built by build_raw_dictionary(),
+prints the storage ratio (raw / stored bytes) and the encode and decode cost in ms per MB of
+raw body text, averaged over `rounds` passes.
+"""
+import random
+import sys
+import time
+from body_codec import encode_body, decode_body, build_raw_dictionary, zstandard, CODEC_ZLIB, CODEC_ZSTD
+
+def _synthetic_bodies(count=300, seed=7):
+    rng = random.Random(seed)
+    words = ['shipping', 'returns', 'organic', 'cotton', 'size', 'guide', 'warranty', 'order', 'store',
+             'delivery', 'customer', 'support', 'exchange', 'gift', 'card', 'product', 'care', 'wash']
+    header = '<div class="page-width rte" style="margin:0 auto;max-width:72rem;padding:2rem 1.5rem">\n'
+    footer = '<p class="contact-note">Questions? Email support@example.com or call +1 555 0100.</p>\n</div>\n'
+    bodies = []
+    for _ in range(count):
+        paragraphs = []
+        for _ in range(rng.randint(3, 12)):
+            sentence = ' '.join(rng.choice(words) for _ in range(rng.randint(20, 60)))
+            paragraphs.append(f'<p style="font-size:1.6rem;line-height:1.8">{sentence.capitalize()}.</p>\n')
+        bodies.append(header + ''.join(paragraphs) + footer)
+    return bodies
+
+def _stored_bodies(shop_domain):
+    from database import db
+    items = (db.get_stored_pages(shop_domain, with_body=True) or []) + (db.get_stored_articles(shop_domain, with_body=True) or [])
+    return [item['body_html'] for item in items if item.get('body_html')]
+
+def run_case(bodies, codec, zdict, rounds):
+    raw_bytes = sum(len(body.encode('utf-8')) for body in bodies)
+    encode_time = decode_time = 0.0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        blobs = [encode_body(body, zdict=zdict, codec=codec) for body in bodies]
+        encode_time += time.perf_counter() - start
+        start = time.perf_counter()
+        for blob in blobs:
+            decode_body(blob, zdict=zdict)
+        decode_time += time.perf_counter() - start
+    stored_bytes = sum(len(blob) for blob in blobs)
+    raw_mb = raw_bytes * rounds / (1024 * 1024)
+    return raw_bytes / stored_bytes, encode_time * 1000 / raw_mb, decode_time * 1000 / raw_mb, stored_bytes
+
+if __name__ == '__main__':
+    import logging
+    logging.disable(logging.INFO)
+
+    shop_domain = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] != '-' else None
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    bodies = _stored_bodies(shop_domain) if shop_domain else _synthetic_bodies()
+    if not bodies:
+        sys.exit(f"No stored bodies found for {shop_domain}")
+    zdict = build_raw_dictionary(bodies)
+    raw_bytes = sum(len(body.encode('utf-8')) for body in bodies)
+    print(f"{len(bodies)} bodies, {raw_bytes / 1024:.1f} KiB raw, {len(zdict) / 1024:.1f} KiB dictionary")
+
+    cases = [('zlib', CODEC_ZLIB, None), ('zlib+dict', CODEC_ZLIB, zdict)]
+    if zstandard is not None:
+        cases += [('zstd', CODEC_ZSTD, None), ('zstd+dict', CODEC_ZSTD, zdict)]
+    else:
+        print("zstandard not installed, skipping zstd")
+
+    print(f"{'codec':>10} {'stored KiB':>11} {'ratio':>7} {'encode ms/MB':>13} {'decode ms/MB':>13}")
+    for name, codec, case_dict in cases:
+        ratio, encode_ms, decode_ms, stored_bytes = run_case(bodies, codec, case_dict or None, rounds)
+        print(f"{name:>10} {stored_bytes / 1024:>11.1f} {ratio:>6.2f}x {encode_ms:>13.1f} {decode_ms:>13.1f}")
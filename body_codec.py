@@ -0,0 +1,88 @@
+# body_codec.py
+import zlib
+from collections import Counter
+from config import logger, BODY_COMPRESSION, BODY_COMPRESSION_LEVEL
+
+try:
+    import zstandard
+except ImportError:  # optional; zlib is always available
+    zstandard = None
+
+# Stored bodies start with a two-byte header: codec id, then flags
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+FLAG_DICTIONARY = 1  # compressed against the shop's raw-content dictionary
+
+# zlib only looks back 32 KB, so a larger preset dictionary would be wasted
+MAX_DICTIONARY_SIZE = 32 * 1024
+
+def _default_codec():
+    if BODY_COMPRESSION == 'zstd':
+        if zstandard is not None:
+            return CODEC_ZSTD
+        logger.warning("BODY_COMPRESSION=zstd but the zstandard package is not installed, using zlib")
+    return CODEC_ZLIB
+
+DEFAULT_CODEC = _default_codec()
+
+def encode_body(text, zdict=None, codec=None, level=BODY_COMPRESSION_LEVEL):
+    """Compress an HTML body for storage. None stays None."""
+    if text is None:
+        return None
+    codec = codec or DEFAULT_CODEC
+    data = text.encode('utf-8')
+    flags = FLAG_DICTIONARY if zdict else 0
+    if codec == CODEC_ZSTD:
+        if zdict:
+            compressor = zstandard.ZstdCompressor(level=level, dict_data=zstandard.ZstdCompressionDict(zdict, dict_type=zstandard.DICT_TYPE_RAWCONTENT))
+        else:
+            compressor = zstandard.ZstdCompressor(level=level)
+        payload = compressor.compress(data)
+    else:
+        compressor = zlib.compressobj(level, zdict=zdict) if zdict else zlib.compressobj(level)
+        payload = compressor.compress(data) + compressor.flush()
+    return bytes([codec, flags]) + payload
+
+def body_uses_dictionary(blob):
+    return blob is not None and len(blob) >= 2 and bool(blob[1] & FLAG_DICTIONARY)
+
+def decode_body(blob, zdict=None):
+    """Inverse of encode_body. zdict must be the dictionary the body was encoded with, if any."""
+    if blob is None:
+        return None
+    blob = bytes(blob)
+    codec, flags, payload = blob[0], blob[1], blob[2:]
+    if flags & FLAG_DICTIONARY and not zdict:
+        raise ValueError("Body was compressed with a shop dictionary that is not available")
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("Body is zstd-compressed but the zstandard package is not installed")
+        if flags & FLAG_DICTIONARY:
+            decompressor = zstandard.ZstdDecompressor(dict_data=zstandard.ZstdCompressionDict(zdict, dict_type=zstandard.DICT_TYPE_RAWCONTENT))
+        else:
+            decompressor = zstandard.ZstdDecompressor()
+        data = decompressor.decompress(payload)
+    else:
+        decompressor = zlib.decompressobj(zdict=zdict) if flags & FLAG_DICTIONARY else zlib.decompressobj()
+        data = decompressor.decompress(payload) + decompressor.flush()
+    return data.decode('utf-8')
+
+def build_raw_dictionary(samples, size=MAX_DICTIONARY_SIZE):
+    """Build a raw-content dictionary from sample bodies: lines that recur in several bodies
+    (theme boilerplate, inline styles), most common last since compressors favour nearby matches."""
+    seen_in = Counter()
+    for sample in samples:
+        for line in set(line.strip() for line in (sample or '').splitlines()):
+            if len(line) >= 8:
+                seen_in[line] += 1
+    shared = [line for line, count in seen_in.most_common() if count >= 2]
+
+    picked = []
+    total = 0
+    for line in shared:
+        encoded = line.encode('utf-8') + b'\n'
+        if total + len(encoded) > size:
+            continue
+        picked.append(encoded)
+        total += len(encoded)
+    return b''.join(reversed(picked))
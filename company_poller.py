@@ -0,0 +1,98 @@
+# company_poller.py
+import time
+import threading
+import requests
+from config import logger, GET_COMPANY_ID_URL
+from database import db
+
+def fetch_company_id(shop_domain):
+    """Ask AeroChat for the shop's company_id once. Returns (company_id or None, HTTP status or None)."""
+    try:
+        response = requests.get(
+            GET_COMPANY_ID_URL,
+            params={"store_url": shop_domain},
+            headers={"Content-Type": "application/json"},
+            timeout=10
+        )
+        logger.info(f"Company ID check for {shop_domain}: {response.status_code} {response.text}")
+        if response.status_code == 200:
+            return response.json().get('company_id'), response.status_code
+        return None, response.status_code
+    except Exception as e:
+        logger.error(f"Company ID check failed for {shop_domain}: {str(e)}")
+        return None, None
+
+class CompanyIdPoller:
+    """Background lookup of AeroChat company IDs for freshly installed shops.
+
+    AeroChat creates the company record asynchronously after install, so the first lookup waits
+    initial_delay seconds and then retries every `interval` seconds up to max_attempts. The
+    company_id is written to the shop row as soon as it appears; request handlers only register
+    shops and read status(), they never wait.
+    """
+    def __init__(self, initial_delay=5, interval=4, max_attempts=5, tick=1.0):
+        self.initial_delay = initial_delay
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.tick = tick
+        self._pending = {}  # shop_domain -> {'status', 'attempts', 'next_at', 'status_code'}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def request(self, shop_domain):
+        """Start polling for the shop unless it is already pending"""
+        with self._lock:
+            state = self._pending.get(shop_domain)
+            if state and state['status'] == 'pending':
+                return
+            self._pending[shop_domain] = {
+                'status': 'pending',
+                'attempts': 0,
+                'next_at': time.monotonic() + self.initial_delay,
+                'status_code': None
+            }
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='company-id-poller', daemon=True)
+                self._thread.start()
+
+    def status(self, shop_domain):
+        """Copy of the shop's state ('pending', 'ready' or 'not_found'), or None if it is not being tracked"""
+        with self._lock:
+            state = self._pending.get(shop_domain)
+            return dict(state) if state else None
+
+    def forget(self, shop_domain):
+        with self._lock:
+            self._pending.pop(shop_domain, None)
+
+    def _due(self):
+        now = time.monotonic()
+        with self._lock:
+            return [shop for shop, state in self._pending.items() if state['status'] == 'pending' and state['next_at'] <= now]
+
+    def _check(self, shop_domain):
+        company_id, status_code = fetch_company_id(shop_domain)
+        if company_id:
+            db.create_or_update_shop(shop_domain, company_id=company_id)
+            logger.info(f"Company ID found: {company_id} for shop: {shop_domain}")
+        with self._lock:
+            state = self._pending.get(shop_domain)
+            if not state:
+                return
+            state['attempts'] += 1
+            state['status_code'] = status_code
+            if company_id:
+                state['status'] = 'ready'
+            elif state['attempts'] >= self.max_attempts:
+                state['status'] = 'not_found'
+                logger.error(f"Store not found in AeroChat after {state['attempts']} attempts for: {shop_domain}")
+            else:
+                state['next_at'] = time.monotonic() + self.interval
+
+    def _loop(self):
+        while True:
+            for shop_domain in self._due():
+                self._check(shop_domain)
+            time.sleep(self.tick)
+
+company_id_poller = CompanyIdPoller()
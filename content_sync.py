@@ -0,0 +1,561 @@
+# content_sync.py
+import os
+import json
+import queue
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from config import (logger, THIRD_PARTY_PUSH_BATCH_SIZE, THIRD_PARTY_PUSH_MAX_BYTES, SYNC_PIPELINE_QUEUE_SIZE, BODY_COMPRESSION_DICTIONARY,
+                    THIRD_PARTY_DELETE_BATCH_SIZE, THIRD_PARTY_DELETE_WORKERS, SYNC_WATERMARK_OVERLAP, SYNC_FULL_REPAIR_INTERVAL)
+from database import db, content_fingerprint
+from utils import iter_content_batches, iter_content_ids, ContentFetchError
+from dashboard_data import dashboard_data
+
+def _third_party_pages_base_url():
+    try:
+        return os.getenv('THIRD_PARTY_BASE')
+    except Exception as e:
+        logger.error(f"Failed to compute third-party base URL: {str(e)}")
+        return None
+
+def _content_payload_item(item):
+    return {
+        'id': item.get('id'),
+        'title': item.get('title'),
+        'handle': item.get('handle'),
+        'body': item.get('body') or item.get('body_html'),
+        'created_at': item.get('created_at'),
+        'updated_at': item.get('updated_at'),
+        'published_at': item.get('published_at'),
+        'published': item.get('published')
+    }
+
+def _chunk_for_push(items, max_items=THIRD_PARTY_PUSH_BATCH_SIZE, max_bytes=THIRD_PARTY_PUSH_MAX_BYTES):
+    """Yield payload entries in chunks of at most max_items entries and roughly max_bytes of JSON.
+    A single entry larger than max_bytes is sent on its own."""
+    chunk, size = [], 0
+    for item in items:
+        entry = _content_payload_item(item)
+        entry_size = len(json.dumps(entry, default=str).encode('utf-8'))
+        if chunk and (len(chunk) >= max_items or size + entry_size > max_bytes):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(entry)
+        size += entry_size
+    if chunk:
+        yield chunk
+
+def _push_content_bulk(resource, company_id, items, prev_sync_time=None):
+    """POST pages/articles to AeroChat in size-bounded chunks. Returns how many items were accepted.
+    Without THIRD_PARTY_BASE there is no AeroChat to keep in step with, so every item counts as accepted."""
+    base = _third_party_pages_base_url()
+    if not base:
+        logger.warning(f"THIRD_PARTY_BASE is not set; skipping AeroChat push of {len(items)} {resource}")
+        return len(items)
+    url = f"{base}/chat/api/v2/{resource}"
+    pushed = 0
+    for chunk in _chunk_for_push(items):
+        try:
+            payload = {
+                'company_id': company_id,
+                resource: chunk,
+                'previous_sync_time': prev_sync_time
+            }
+            r = requests.post(url, json=payload, timeout=20)
+            logger.info(f"Third-party {resource} bulk sync status: {r.status_code} for {len(chunk)} items")
+            if r.ok:
+                pushed += len(chunk)
+        except Exception as e:
+            logger.error(f"Third-party {resource} bulk sync failed for {len(chunk)} items: {str(e)}")
+    return pushed
+
+def push_message(resource, company_id, items, prev_sync_time=None):
+    """Outbox message pushing these pages/articles to AeroChat. It carries only ids; outbox.py loads
+    the stored rows when it is delivered, so the latest saved content is sent."""
+    return (f'push_{resource}', {
+        'company_id': company_id,
+        'ids': [str(item.get('id')) for item in items],
+        'previous_sync_time': prev_sync_time
+    })
+
+def _call_third_party_pages_bulk(company_id, pages, prev_sync_time=None):
+    return _push_content_bulk('pages', company_id, pages, prev_sync_time=prev_sync_time)
+
+def _delete_content_one(resource, company_id, item_id):
+    """Delete one page/article in AeroChat. Returns True if it was accepted."""
+    try:
+        base = _third_party_pages_base_url()
+        if not base:
+            logger.warning(f"THIRD_PARTY_BASE is not set; skipping AeroChat delete of {resource} {item_id}")
+            return True  # nothing to keep in step with
+        url = f"{base}/chat/api/v2/{resource}"
+        payload = {
+            'action': 'delete',
+            'company_id': company_id,
+            resource[:-1]: { 'id': item_id }
+        }
+        r = requests.post(url, json=payload, timeout=10)
+        logger.info(f"Third-party {resource} delete status: {r.status_code} for id {item_id}")
+        return r.ok
+    except Exception as e:
+        logger.error(f"Third-party {resource} delete failed for {item_id}: {str(e)}")
+        return False
+
+def _bulk_delete_chunk(url, resource, company_id, ids):
+    """One bulk delete request. Returns {id: bool} for the ids AeroChat reported on, or None when
+    the endpoint does not support bulk deletes or the request failed outright."""
+    try:
+        payload = {
+            'action': 'bulk_delete',
+            'company_id': company_id,
+            'ids': ids
+        }
+        r = requests.post(url, json=payload, timeout=30)
+        logger.info(f"Third-party {resource} bulk delete status: {r.status_code} for {len(ids)} ids")
+        if not r.ok:
+            return None
+        # Expected response: {"results": [{"id": ..., "success": true|false}, ...]}
+        results = r.json().get('results')
+        if not isinstance(results, list):
+            return None
+        return {str(entry.get('id')): bool(entry.get('success')) for entry in results if isinstance(entry, dict)}
+    except Exception as e:
+        logger.error(f"Third-party {resource} bulk delete failed for {len(ids)} ids: {str(e)}")
+        return None
+
+def _delete_content_bulk(resource, company_id, ids, batch_size=THIRD_PARTY_DELETE_BATCH_SIZE, workers=THIRD_PARTY_DELETE_WORKERS):
+    """Delete pages/articles in AeroChat, many ids per request. Ids a bulk request did not confirm
+    (including every id of a request the endpoint rejected) fall back to per-id deletes on a pool
+    of `workers` threads. Returns the set of ids AeroChat confirmed as deleted."""
+    ids = [str(item_id) for item_id in ids]
+    base = _third_party_pages_base_url()
+    if not ids:
+        return set()
+    if not base:
+        # Same as pushes: with no AeroChat configured there is nothing to keep in step with
+        logger.warning(f"THIRD_PARTY_BASE is not set; skipping AeroChat delete of {len(ids)} {resource}")
+        return set(ids)
+    url = f"{base}/chat/api/v2/{resource}"
+    confirmed = set()
+    retry_ids = []
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        results = _bulk_delete_chunk(url, resource, company_id, chunk)
+        if results is None:
+            retry_ids.extend(chunk)
+            continue
+        for item_id in chunk:
+            if results.get(item_id):
+                confirmed.add(item_id)
+            elif item_id not in results:
+                retry_ids.append(item_id)
+    if retry_ids:
+        logger.info(f"Deleting {len(retry_ids)} {resource} one by one")
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(retry_ids))), thread_name_prefix=f'{resource}-delete') as executor:
+            for item_id, ok in zip(retry_ids, executor.map(lambda item_id: _delete_content_one(resource, company_id, item_id), retry_ids)):
+                if ok:
+                    confirmed.add(item_id)
+    return confirmed
+
+def _call_third_party_page_delete(company_id, page_id):
+    return _delete_content_one('pages', company_id, page_id)
+
+def _call_third_party_pages_delete(company_id, page_ids):
+    return _delete_content_bulk('pages', company_id, page_ids)
+
+def _call_third_party_article_delete(company_id, article_id):
+    return _delete_content_one('articles', company_id, article_id)
+
+def _call_third_party_articles_delete(company_id, article_ids):
+    return _delete_content_bulk('articles', company_id, article_ids)
+
+def _classify_content_batch(items, existing_meta, company_id, counts):
+    """Split fetched pages/articles into those to upsert (new or changed content_hash) and unchanged ids.
+    Tallies 'new', 'changed' and 'unchanged' into counts."""
+    upsert_batch = []
+    unchanged_ids = []
+    for item in items:
+        item['company_id'] = company_id
+        item_id = str(item.get('id'))
+        prev = existing_meta.get(item_id)
+        if prev is None:
+            counts['new'] += 1
+        elif prev.get('content_hash') == content_fingerprint(item):
+            counts['unchanged'] += 1
+            unchanged_ids.append(item_id)
+            continue
+        else:
+            counts['changed'] += 1
+        # preserve existing chunk_ids by not overwriting them
+        if prev and prev.get('chunk_ids') is not None:
+            item['chunk_ids'] = prev['chunk_ids']
+        upsert_batch.append(item)
+    return upsert_batch, unchanged_ids
+
+def _call_third_party_articles_bulk(company_id, articles, prev_sync_time=None):
+    return _push_content_bulk('articles', company_id, articles, prev_sync_time=prev_sync_time)
+
+def _content_ops(resource):
+    """DB, Shopify and AeroChat helpers for 'pages' or 'articles'"""
+    if resource == 'pages':
+        return {
+            'label': 'Page',
+            'get_meta': db.get_pages_meta_for_shop,
+            'save': db.save_pages,
+            'touch': db.update_last_sync_time_for_ids,
+            'previous_sync_time': db.get_previous_pages_sync_time,
+            'delete_ids': db.delete_pages_by_ids,
+            'synced_count': db.get_pages_count,
+            'push_delete': _call_third_party_pages_delete,
+        }
+    return {
+        'label': 'Article',
+        'get_meta': db.get_articles_meta_for_shop,
+        'save': db.save_articles,
+        'touch': db.update_articles_last_sync_time_for_ids,
+        'previous_sync_time': db.get_previous_articles_sync_time,
+        'delete_ids': db.delete_articles_by_ids,
+        'synced_count': db.get_articles_count,
+        'push_delete': _call_third_party_articles_delete,
+    }
+
+def _newest_updated_at(items, newest=None):
+    """Latest Shopify updated_at (naive UTC) among items, or newest if none is later"""
+    for item in items:
+        value = item.get('updated_at')
+        try:
+            updated_at = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except (AttributeError, ValueError):
+            continue
+        if updated_at.tzinfo is not None:
+            updated_at = updated_at.astimezone(timezone.utc).replace(tzinfo=None)
+        if newest is None or updated_at > newest:
+            newest = updated_at
+    return newest
+
+def _choose_sync_mode(mode, state, now):
+    """Resolve a requested 'auto', 'full' or 'incremental' mode to 'full' or 'incremental'. Incremental
+    needs a watermark; 'auto' also falls back to a full repair scan every SYNC_FULL_REPAIR_INTERVAL."""
+    if mode == 'full' or state.get('watermark') is None:
+        return 'full'
+    if mode == 'auto':
+        full_sync_at = state.get('full_sync_at')
+        if full_sync_at is None or (now - full_sync_at).total_seconds() >= SYNC_FULL_REPAIR_INTERVAL:
+            return 'full'
+    return 'incremental'
+
+def _updated_since_query(watermark):
+    """Shopify search query for items updated after the watermark, less SYNC_WATERMARK_OVERLAP seconds
+    to cover clock skew and search index lag (re-fetched unchanged items are skipped by content_hash)"""
+    since = watermark - timedelta(seconds=SYNC_WATERMARK_OVERLAP)
+    return f"updated_at:>'{since.strftime('%Y-%m-%dT%H:%M:%SZ')}'"
+
+def _missing_ids(local_ids, remote_id_batches):
+    """The local ids absent from a streamed listing of Shopify ids. Each batch is struck off a set of
+    the local ids as it arrives, so memory stays bounded by the stored items, not the listing."""
+    missing = set(local_ids)
+    for ids in remote_id_batches:
+        missing.difference_update(str(item_id) for item_id in ids)
+    return missing
+
+def _report(progress, **counts):
+    if progress:
+        progress(**counts)
+
+_DONE = object()  # end-of-stream marker passed between pipeline stages
+
+def _put(stage_queue, item, stop):
+    """Blocking put that gives up once the pipeline is being torn down"""
+    while not stop.is_set():
+        try:
+            stage_queue.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def sync_content(shop, access_token, company_id, resource, progress=None, mode='auto'):
+    """Sync Shopify pages or articles: upsert created/edited and delete removed items. Adds company_id, last_sync_time, keeps chunk_ids.
+
+    mode 'full' lists every item. 'incremental' only asks Shopify for items updated since the shop's
+    watermark (see db.get_sync_watermark) and finds deletions with an id-only listing. 'auto' is
+    incremental, except that it runs a full repair scan when there is no watermark yet or the last
+    full scan is more than SYNC_FULL_REPAIR_INTERVAL seconds old.
+
+    Runs as a two-stage pipeline joined by a bounded queue: a fetch thread pulls normalized batches
+    from Shopify while this thread classifies and upserts them. At most SYNC_PIPELINE_QUEUE_SIZE
+    batches wait between stages, so memory stays flat however large the store is. Each upsert also
+    writes an outbox message in the same transaction, and the outbox dispatcher pushes the
+    new/changed items to AeroChat.
+
+    progress, if given, is called with fetched/saved/queued/deleted increments as the sync advances.
+    Returns a report dict; its status is 'partial' (and nothing is deleted) when the Shopify listing
+    could not be completed or a batch could not be saved. The watermark only advances after a
+    completed listing whose batches were all saved.
+    """
+    ops = _content_ops(resource)
+    sync_time = datetime.utcnow()
+    total_saved = 0
+    failed_saves = 0
+
+    existing_meta = ops['get_meta'](shop)
+    existing_ids_before = set(existing_meta.keys())
+
+    change_counts = {'new': 0, 'changed': 0, 'unchanged': 0}
+    previous_sync_time = ops['previous_sync_time'](shop)
+    prev_sync_iso = previous_sync_time.isoformat() if previous_sync_time else None
+
+    sync_state = db.get_sync_watermark(shop, resource)
+    mode = _choose_sync_mode(mode, sync_state, sync_time)
+    search_query = _updated_since_query(sync_state['watermark']) if mode == 'incremental' else None
+    logger.info(f"Running {mode} {resource} sync for {shop}" + (f" ({search_query})" if search_query else ""))
+    newest_updated_at = None
+    # A full listing reconciles as it streams; an incremental one is followed by an id-only listing
+    missing_ids = set(existing_ids_before)
+
+    stop = threading.Event()
+    fetched = queue.Queue(maxsize=SYNC_PIPELINE_QUEUE_SIZE)
+    fetch_errors = []
+
+    def fetch_stage():
+        try:
+            # Cursor paging for small stores, a streamed Bulk Operation for large ones
+            for items in iter_content_batches(shop, access_token, resource, search_query=search_query):
+                if not _put(fetched, items, stop):
+                    return
+                _report(progress, fetched=len(items))
+        except Exception as e:
+            fetch_errors.append(e)
+        finally:
+            _put(fetched, _DONE, stop)
+
+    fetcher = threading.Thread(target=fetch_stage, name=f'{resource}-fetch-{shop}', daemon=True)
+    fetcher.start()
+    try:
+        while True:
+            items = fetched.get()
+            if items is _DONE:
+                break
+            upsert_batch, unchanged_ids = _classify_content_batch(items, existing_meta, company_id, change_counts)
+            newest_updated_at = _newest_updated_at(items, newest_updated_at)
+
+            # Only new and changed items are rewritten and pushed; unchanged ones just get their sync time bumped
+            if upsert_batch:
+                outbox = [push_message(resource, company_id, upsert_batch, prev_sync_time=prev_sync_iso)]
+                if ops['save'](shop, upsert_batch, company_id=company_id, sync_time=sync_time, outbox=outbox):
+                    total_saved += len(upsert_batch)
+                    _report(progress, saved=len(upsert_batch), queued=len(upsert_batch))
+                else:
+                    failed_saves += len(upsert_batch)
+            if unchanged_ids:
+                ops['touch'](shop, unchanged_ids, sync_time)
+            missing_ids.difference_update(str(item.get('id')) for item in items)
+    finally:
+        # Let a still-running fetch thread exit
+        stop.set()
+
+    fetch_error = None
+    if fetch_errors:
+        if not isinstance(fetch_errors[0], ContentFetchError):
+            raise fetch_errors[0]
+        fetch_error = str(fetch_errors[0])
+    else:
+        # Everything Shopify changed up to the newest updated_at listed is stored now; a full listing
+        # of an empty store has nothing newer than this sync. After a failed save the watermark stays
+        # put, so the retry lists those items again.
+        watermark = newest_updated_at or (sync_time if mode == 'full' else None)
+        if watermark is not None and not failed_saves:
+            db.set_sync_watermark(shop, resource, watermark=watermark)
+        if mode == 'incremental':
+            # The incremental listing only has changed items; deletions come from a listing of ids
+            try:
+                missing_ids = _missing_ids(existing_ids_before, iter_content_ids(shop, access_token, resource))
+            except ContentFetchError as e:
+                fetch_error = f"Listing {resource} ids failed: {str(e)}"
+
+    # A failed page means we never saw the full listing, so nothing can be treated as deleted
+    if fetch_error:
+        logger.error(f"{ops['label']} sync for {shop} stopped early, skipping deletions: {fetch_error}")
+        return {
+            'status': 'partial',
+            'mode': mode,
+            'saved': total_saved,
+            'failed': failed_saves,
+            **change_counts,
+            'deleted': 0,
+            'last_sync_time': sync_time.isoformat(),
+            'error': fetch_error
+        }
+
+    # Anything stored before the sync that Shopify no longer lists was deleted there
+    to_delete_ids = sorted(missing_ids)
+    # Delete in AeroChat first; only rows it confirmed are removed locally, the rest are retried next sync
+    deleted_count = 0
+    confirmed_ids = set()
+    if to_delete_ids:
+        confirmed_ids = ops['push_delete'](company_id, to_delete_ids)
+        if len(confirmed_ids) < len(to_delete_ids):
+            logger.warning(f"AeroChat did not confirm {len(to_delete_ids) - len(confirmed_ids)} of {len(to_delete_ids)} {resource} deletions for {shop}")
+        if confirmed_ids:
+            deleted_count = ops['delete_ids'](shop, sorted(confirmed_ids))
+    _report(progress, deleted=deleted_count)
+    if mode == 'full' and not failed_saves:
+        db.set_sync_watermark(shop, resource, full_sync_at=sync_time)
+
+    # Get updated counts after sync; the sync is a good moment to refresh the cached Shopify totals
+    synced_count = ops['synced_count'](shop)
+    shopify_data = dashboard_data.refresh(shop, access_token) or dashboard_data.get(shop, access_token)
+    total_count = shopify_data[resource]
+
+    # Items whose batch could not be saved make the sync partial, so the job is retried
+    save_error = f"{failed_saves} {resource} could not be saved" if failed_saves else None
+    if save_error:
+        logger.error(f"{ops['label']} sync for {shop} incomplete: {save_error}")
+
+    return {
+        'status': 'partial' if save_error else 'success',
+        'mode': mode,
+        'saved': total_saved,
+        'failed': failed_saves,
+        **change_counts,
+        'deleted': deleted_count,
+        'delete_pending': len(to_delete_ids) - len(confirmed_ids),
+        'last_sync_time': sync_time.isoformat(),
+        'synced_count': synced_count,
+        'total_count': total_count,
+        'error': save_error
+    }
+
+def _initial_sync_resource(shop, access_token, company_id, resource, sync_time, push=True, max_attempts=3):
+    """Save (with retries) every page or article of the shop, optionally queueing AeroChat pushes. Returns (saved, errors)."""
+    ops = _content_ops(resource)
+    saved = 0
+    errors = []
+    newest_updated_at = None
+    logger.info(f"Syncing {resource} for {shop}")
+    try:
+        # Cursor paging for small stores, a streamed Bulk Operation for large ones
+        for items in iter_content_batches(shop, access_token, resource):
+            newest_updated_at = _newest_updated_at(items, newest_updated_at)
+            try:
+                # Add company_id to each item
+                for item in items:
+                    item['company_id'] = company_id
+
+                # The AeroChat push is queued with the rows; articles are not pushed during the initial sync
+                outbox = [push_message(resource, company_id, items)] if push else None
+
+                # Save to database with retry logic
+                db_success = False
+                for attempt in range(max_attempts):
+                    if ops['save'](shop, items, company_id=company_id, sync_time=sync_time, outbox=outbox):
+                        db_success = True
+                        break
+                    logger.warning(f"Database save attempt {attempt + 1} failed for {resource}")
+
+                if not db_success:
+                    errors.append(f"Failed to save {resource} after {max_attempts} attempts")
+                    continue
+                saved += len(items)
+            except Exception as batch_error:
+                logger.error(f"Error syncing {resource} batch for {shop}: {str(batch_error)}")
+                errors.append(f"{resource.capitalize()} sync error: {str(batch_error)}")
+    except ContentFetchError as fetch_error:
+        logger.error(f"Fetching {resource} for {shop} stopped early: {str(fetch_error)}")
+        errors.append(f"{resource.capitalize()} fetch error: {str(fetch_error)}")
+    # A clean initial sync is a full scan, so later syncs can start incremental
+    if not errors:
+        db.set_sync_watermark(shop, resource, watermark=newest_updated_at or sync_time, full_sync_at=sync_time)
+    return saved, errors
+
+def initial_sync_pages_and_articles(shop, access_token, company_id):
+    """Perform initial sync of pages and articles during app installation. This is called only once.
+
+    Pages and articles are independent, so both streams run at the same time; their Shopify calls
+    share the shop's rate budget through shopify_client.
+    """
+    logger.info(f"Starting initial sync for shop: {shop}")
+    
+    try:
+        sync_time = datetime.utcnow()
+        sync_errors = []
+
+        # Third-party sync of articles is still disabled during the initial sync
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix=f'initial-sync-{shop}') as executor:
+            pages_future = executor.submit(_initial_sync_resource, shop, access_token, company_id, 'pages', sync_time)
+            articles_future = executor.submit(_initial_sync_resource, shop, access_token, company_id, 'articles', sync_time, push=False)
+            pages_saved, page_errors = pages_future.result()
+            articles_saved, article_errors = articles_future.result()
+        sync_errors.extend(page_errors)
+        sync_errors.extend(article_errors)
+        dashboard_data.invalidate(shop)
+
+        # Bodies saved above were compressed on their own; with a shop dictionary they shrink further
+        if BODY_COMPRESSION_DICTIONARY and db.create_body_dictionary(shop):
+            logger.info(f"Recompressed {db.recompress_bodies(shop)} bodies with the shop dictionary for {shop}")
+        
+        # Mark initial sync as completed even if there were some errors
+        # This prevents infinite retry loops during installation
+        try:
+            db.create_or_update_shop(shop, initial_sync_completed=True)
+        except Exception as update_error:
+            logger.error(f"Failed to mark initial sync as completed: {str(update_error)}")
+            sync_errors.append(f"Failed to update sync status: {str(update_error)}")
+        
+        # Log results
+        if sync_errors:
+            logger.warning(f"Initial sync completed with errors for {shop}: {pages_saved} pages, {articles_saved} articles. Errors: {sync_errors}")
+        else:
+            logger.info(f"Initial sync completed successfully for {shop}: {pages_saved} pages, {articles_saved} articles")
+        
+        return {
+            'success': True,
+            'pages_saved': pages_saved,
+            'articles_saved': articles_saved,
+            'sync_time': sync_time.isoformat(),
+            'errors': sync_errors if sync_errors else None
+        }
+        
+    except Exception as e:
+        logger.error(f"Critical error during initial sync for {shop}: {str(e)}")
+        # Still mark as completed to prevent retry loops
+        try:
+            db.create_or_update_shop(shop, initial_sync_completed=True)
+        except:
+            pass
+        return {
+            'success': False,
+            'error': str(e),
+            'pages_saved': 0,
+            'articles_saved': 0
+        }
+
+def sync_all_content(shop, access_token, company_id, progress=None, mode='auto'):
+    """Run the pages and articles syncs concurrently (see sync_content for mode) and merge their reports.
+    Returns {'status', 'pages_saved', 'articles_saved', 'errors', 'pages', 'articles'}; status is
+    'partial' if either stream could not be completed."""
+    reports = {}
+    errors = []
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix=f'sync-all-{shop}') as executor:
+        futures = {
+            resource: executor.submit(sync_content, shop, access_token, company_id, resource, progress, mode)
+            for resource in ('pages', 'articles')
+        }
+        for resource, future in futures.items():
+            try:
+                reports[resource] = future.result()
+            except Exception as e:
+                logger.error(f"{resource.capitalize()} sync failed for {shop}: {str(e)}")
+                reports[resource] = {'status': 'error', 'saved': 0, 'error': str(e)}
+            if reports[resource].get('error'):
+                errors.append(f"{resource.capitalize()}: {reports[resource]['error']}")
+
+    return {
+        'status': 'success' if not errors else 'partial',
+        'pages_saved': reports['pages'].get('saved', 0),
+        'articles_saved': reports['articles'].get('saved', 0),
+        'errors': errors if errors else None,
+        'pages': reports['pages'],
+        'articles': reports['articles']
+    }
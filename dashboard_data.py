@@ -0,0 +1,88 @@
+# dashboard_data.py
+import time
+import threading
+from config import logger, DASHBOARD_DATA_TTL, DASHBOARD_DATA_MAX_STALE
+from utils import get_dashboard_data
+
+EMPTY_DASHBOARD_DATA = {'pages': 0, 'articles': 0, 'products': 0, 'collections': 0, 'shop_name': None, 'subscription_status': None, 'subscription_name': None}
+
+class DashboardDataCache:
+    """Per-shop cache of the Shopify data the dashboards show (utils.get_dashboard_data): page,
+    article, product and collection totals, shop name and subscription status.
+
+    Data younger than ttl seconds is served as-is. Older data (up to max_stale) is still
+    served, and a background thread refreshes it, so dashboard loads never wait on Shopify
+    once a shop has been seen. Only a shop with no usable data is fetched inline, and
+    concurrent callers share that one fetch. Syncs refresh() and content changes invalidate().
+    """
+    def __init__(self, ttl=DASHBOARD_DATA_TTL, max_stale=DASHBOARD_DATA_MAX_STALE):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._entries = {}  # shop -> {'data', 'fetched_at'}
+        self._lock = threading.Lock()
+        self._fetch_locks = {}  # shop -> Lock held while an inline fetch runs
+        self._refreshing = set()
+
+    def get(self, shop, access_token):
+        """Cached dashboard data for the shop (see get_dashboard_data); zeros and None if Shopify is unreachable"""
+        with self._lock:
+            entry = self._entries.get(shop)
+        if entry:
+            age = time.monotonic() - entry['fetched_at']
+            if age < self.ttl:
+                return dict(entry['data'])
+            if age < self.max_stale:
+                self._refresh_in_background(shop, access_token)
+                return dict(entry['data'])
+
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(shop, threading.Lock())
+        with fetch_lock:
+            # Another caller may have fetched while we waited
+            with self._lock:
+                entry = self._entries.get(shop)
+            if entry and time.monotonic() - entry['fetched_at'] < self.ttl:
+                return dict(entry['data'])
+            data = self.refresh(shop, access_token)
+        if data is None:
+            return dict(entry['data']) if entry else dict(EMPTY_DASHBOARD_DATA)
+        return data
+
+    def refresh(self, shop, access_token):
+        """Fetch the dashboard data from Shopify now and cache it. Returns it, or None on failure."""
+        data = get_dashboard_data(shop, access_token)
+        if data is not None:
+            with self._lock:
+                self._entries[shop] = {'data': data, 'fetched_at': time.monotonic()}
+        return dict(data) if data is not None else None
+
+    def invalidate(self, shop):
+        """Mark the shop's data stale; the next get() serves it once more while refreshing in the background"""
+        with self._lock:
+            entry = self._entries.get(shop)
+            if entry:
+                entry['fetched_at'] = min(entry['fetched_at'], time.monotonic() - self.ttl)
+
+    def forget(self, shop):
+        with self._lock:
+            self._entries.pop(shop, None)
+            self._fetch_locks.pop(shop, None)
+
+    def _refresh_in_background(self, shop, access_token):
+        with self._lock:
+            if shop in self._refreshing:
+                return
+            self._refreshing.add(shop)
+
+        def run():
+            try:
+                self.refresh(shop, access_token)
+            except Exception as e:
+                logger.error(f"Background dashboard data refresh failed for {shop}: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(shop)
+
+        threading.Thread(target=run, name=f'dashboard-data-{shop}', daemon=True).start()
+
+dashboard_data = DashboardDataCache()
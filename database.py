@@ -1,13 +1,21 @@
 # database.py
+import time
+import select
+import threading
 from threading import Lock
-from config import logger, datetime, json
+from collections import OrderedDict
+from contextlib import contextmanager
+from config import logger, datetime, json, SHOP_CACHE_SIZE, SHOP_CACHE_TTL, OUTBOX_MAX_ATTEMPTS
+from body_codec import encode_body, decode_body, body_uses_dictionary, build_raw_dictionary
+from datetime import timedelta
 import os
-from sqlalchemy import create_engine, Column, String, DateTime, Text, Integer, Boolean, JSON
+from sqlalchemy import create_engine, Column, String, DateTime, Text, Integer, Boolean, JSON, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, scoped_session
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker, scoped_session, deferred, undefer_group, aliased, object_session
+from sqlalchemy.dialects.postgresql import UUID, ARRAY, insert as pg_insert
+from sqlalchemy import text, or_, cast, func, literal, literal_column, any_, all_, select as sa_select
 import uuid
+import hashlib
 
 # Database Models
 Base = declarative_base()
@@ -18,10 +26,10 @@ class Shop(Base):
     shop_domain = Column(String(255), primary_key=True)
     shop_id = Column(String(100))
     shop_name = Column(String(255))
-    email = Column(String(255))
+    email = Column(String(255), index=True)
     access_token = Column(Text)
     store_url = Column(String(255))
-    company_id = Column(String(100))
+    company_id = Column(String(100), index=True)
     script_id = Column(String(100))  # AeroChat script ID for metafield approach
     status = Column(String(50), default='active')
     initial_sync_completed = Column(Boolean, default=False)
@@ -41,14 +49,36 @@ class Subscription(Base):
     created_at = Column(DateTime)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
-class Page(Base):
+    __table_args__ = (Index('ix_subscriptions1_shop_domain_status', 'shop_domain', 'status'),)
+
+class CompressedBodyMixin:
+    """body_html of Page/Article, stored compressed in body_compressed (optionally against the shop's
+    dictionary). Rows written before compression keep their text in the legacy body_html column.
+    Both columns are in the deferred 'body' group; load them with undefer_group('body'). A dictionary
+    that is not cached yet is read through the row's own session, which is never closed here."""
+    @property
+    def body_html(self):
+        if self.body_compressed is None:
+            return self._body_html
+        zdict = None
+        if body_uses_dictionary(self.body_compressed):
+            zdict = db.get_body_dictionary(self.shop_domain, required=True, session=object_session(self))
+        return decode_body(self.body_compressed, zdict=zdict)
+
+    @body_html.setter
+    def body_html(self, value):
+        self.body_compressed = encode_body(value, zdict=db.get_body_dictionary(self.shop_domain, session=object_session(self)))
+        self._body_html = None
+
+class Page(CompressedBodyMixin, Base):
     __tablename__ = 'pages1'
 
     id = Column(String(100), primary_key=True)  # Shopify GraphQL ID or numeric ID as string
     shop_domain = Column(String(255), index=True)
     title = Column(String(512))
     handle = Column(String(512))
-    body_html = Column(Text)
+    _body_html = deferred(Column('body_html', Text), group='body')  # legacy plain-text bodies, NULL once compressed
+    body_compressed = deferred(Column(LargeBinary), group='body')  # body_codec.encode_body(); read through body_html
     created_at = Column(DateTime)
     updated_at = Column(DateTime)
     store_id = Column(String(100))
@@ -57,15 +87,19 @@ class Page(Base):
     chunk_ids = Column(JSON)
     published = Column(Boolean, default=True)
     published_at = Column(DateTime)
+    content_hash = Column(String(64))  # content_fingerprint() of title, handle, body and published state
+
+    __table_args__ = (Index('ix_pages1_shop_domain_last_sync_time', 'shop_domain', 'last_sync_time'),)
 
-class Article(Base):
+class Article(CompressedBodyMixin, Base):
     __tablename__ = 'articles'
 
     id = Column(String(100), primary_key=True)  # Shopify GraphQL ID or numeric ID as string
     shop_domain = Column(String(255), index=True)
     title = Column(String(512))
     handle = Column(String(512))
-    body_html = Column(Text)
+    _body_html = deferred(Column('body_html', Text), group='body')  # legacy plain-text bodies, NULL once compressed
+    body_compressed = deferred(Column(LargeBinary), group='body')  # body_codec.encode_body(); read through body_html
     created_at = Column(DateTime)
     updated_at = Column(DateTime)
     store_id = Column(String(100))
@@ -74,11 +108,298 @@ class Article(Base):
     chunk_ids = Column(JSON)
     published = Column(Boolean, default=True)
     published_at = Column(DateTime)
+    content_hash = Column(String(64))  # content_fingerprint() of title, handle, body and published state
+
+    __table_args__ = (Index('ix_articles_shop_domain_last_sync_time', 'shop_domain', 'last_sync_time'),)
+
+class SyncJob(Base):
+    __tablename__ = 'sync_jobs'
+
+    id = Column(String(100), primary_key=True, default=lambda: str(uuid.uuid4()))
+    shop_domain = Column(String(255), index=True)
+    job_type = Column(String(50))  # sync_pages, sync_articles, sync_all, full_sync or initial_sync
+    status = Column(String(20), default='queued')  # queued, running, succeeded, failed
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    progress = Column(JSON)  # running fetched/saved/queued/deleted counters
+    result = Column(JSON)
+    error = Column(Text)
+    run_after = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+
+    __table_args__ = (Index('ix_sync_jobs_status_run_after', 'status', 'run_after'),)
+
+class ShopContentStats(Base):
+    """Synced page/article counts and sync times per shop, kept in step with pages1/articles by the
+    save/delete methods inside the same transaction so dashboards never COUNT(*) the content tables.
+    The *_watermark columns hold the newest Shopify updated_at seen by a completed sync listing, and
+    *_full_sync_at when a full scan last finished; incremental syncs start from them."""
+    __tablename__ = 'shop_content_stats'
+
+    shop_domain = Column(String(255), primary_key=True)
+    pages_count = Column(Integer, default=0, nullable=False)
+    articles_count = Column(Integer, default=0, nullable=False)
+    pages_last_sync_time = Column(DateTime)
+    articles_last_sync_time = Column(DateTime)
+    pages_watermark = Column(DateTime)
+    articles_watermark = Column(DateTime)
+    pages_full_sync_at = Column(DateTime)
+    articles_full_sync_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ShopBodyDictionary(Base):
+    """Raw-content compression dictionary shared by a shop's page/article bodies. Written once and
+    never replaced, since stored bodies can only be decoded with the dictionary they were encoded with."""
+    __tablename__ = 'shop_body_dictionaries'
+
+    shop_domain = Column(String(255), primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    sample_count = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class OutboxMessage(Base):
+    """A call to AeroChat recorded in the same transaction as the local change that requires it, and
+    delivered later by outbox.OutboxDispatcher. Delivered messages are deleted; failed ones are kept."""
+    __tablename__ = 'outbox'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    shop_domain = Column(String(255), index=True)
+    kind = Column(String(50))  # see outbox.HANDLERS
+    payload = Column(JSON)
+    status = Column(String(20), default='pending')  # pending, sending, failed
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=8)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    claimed_at = Column(DateTime)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index('ix_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),)
+
+class WebhookDelivery(Base):
+    """Accepted Shopify webhook deliveries, keyed by X-Shopify-Webhook-Id. Doubles as the queue the
+    webhook workers drain (see webhook_queue.py) and as the redelivery filter: ids stay until
+    WEBHOOK_DEDUPE_TTL after receipt, and the raw payload is dropped once processed."""
+    __tablename__ = 'webhook_deliveries'
+
+    webhook_id = Column(String(100), primary_key=True)
+    topic = Column(String(100))
+    shop_domain = Column(String(255))
+    received_at = Column(DateTime, default=datetime.utcnow, index=True)
+    payload = Column(Text)  # raw request body, kept until processed (and for failed events)
+    status = Column(String(20), default='queued')  # queued, processing, done, coalesced, failed
+    attempts = Column(Integer, default=0)
+    process_after = Column(DateTime, default=datetime.utcnow)
+    claimed_at = Column(DateTime)
+    processed_at = Column(DateTime)
+    error = Column(Text)
+
+    __table_args__ = (Index('ix_webhook_deliveries_status_process_after', 'status', 'process_after'),)
+
+# Columns copied verbatim from the incoming item on every upsert
+CONTENT_UPSERT_COLUMNS = ('title', 'handle', 'body_html', 'body_compressed', 'created_at', 'updated_at', 'store_id', 'company_id', 'published_at', 'content_hash')
+
+class SchemaMigration(Base):
+    __tablename__ = 'schema_migrations'
+
+    id = Column(String(100), primary_key=True)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+def _online_index(name, table, columns):
+    """Migration building an index without blocking writes; the migration id is the index name"""
+    return (name, f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+
+# Changes to tables that already exist; create_all() only creates missing tables. Applied once each,
+# in order, at startup and recorded in schema_migrations. Index names match the models so fresh
+# databases (where create_all() already built them) just record them.
+MIGRATIONS = [
+    ('pages1_content_hash', "ALTER TABLE pages1 ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)"),
+    ('articles_content_hash', "ALTER TABLE articles ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)"),
+    _online_index('ix_shops1_company_id', 'shops1', ['company_id']),
+    _online_index('ix_shops1_email', 'shops1', ['email']),
+    _online_index('ix_subscriptions1_shop_domain_status', 'subscriptions1', ['shop_domain', 'status']),
+    _online_index('ix_pages1_shop_domain_last_sync_time', 'pages1', ['shop_domain', 'last_sync_time']),
+    _online_index('ix_articles_shop_domain_last_sync_time', 'articles', ['shop_domain', 'last_sync_time']),
+    ('pages1_body_compressed', "ALTER TABLE pages1 ADD COLUMN IF NOT EXISTS body_compressed BYTEA"),
+    ('articles_body_compressed', "ALTER TABLE articles ADD COLUMN IF NOT EXISTS body_compressed BYTEA"),
+    ('webhook_deliveries_queue_columns',
+     "ALTER TABLE webhook_deliveries ADD COLUMN IF NOT EXISTS payload TEXT, "
+     "ADD COLUMN IF NOT EXISTS status VARCHAR(20) DEFAULT 'done', ADD COLUMN IF NOT EXISTS attempts INTEGER DEFAULT 0, "
+     "ADD COLUMN IF NOT EXISTS process_after TIMESTAMP, ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP, "
+     "ADD COLUMN IF NOT EXISTS processed_at TIMESTAMP, ADD COLUMN IF NOT EXISTS error TEXT"),
+    _online_index('ix_webhook_deliveries_status_process_after', 'webhook_deliveries', ['status', 'process_after']),
+    ('shop_content_stats_watermarks',
+     "ALTER TABLE shop_content_stats ADD COLUMN IF NOT EXISTS pages_watermark TIMESTAMP, "
+     "ADD COLUMN IF NOT EXISTS articles_watermark TIMESTAMP, ADD COLUMN IF NOT EXISTS pages_full_sync_at TIMESTAMP, "
+     "ADD COLUMN IF NOT EXISTS articles_full_sync_at TIMESTAMP"),
+]
+
+# pg_advisory_lock key so only one process runs migrations at a time
+MIGRATION_LOCK_ID = 720431
+
+# pg_try_advisory_xact_lock namespaces (paired with hashtext(shop_domain)) serializing per-shop claims
+OUTBOX_CLAIM_LOCK_ID = 720432
+WEBHOOK_CLAIM_LOCK_ID = 720433
+JOB_CLAIM_LOCK_ID = 720434
+
+# Postgres NOTIFY channel carrying shop_domains whose cached shop record is stale
+SHOP_CACHE_CHANNEL = 'shop_cache_invalidate'
+
+def content_fingerprint(item):
+    """SHA-256 of the fields AeroChat indexes (title, handle, body, published state) for a page/article dict"""
+    published = item.get('published')
+    if published is None:
+        published = bool(item.get('published_at'))
+    body = item.get('body_html') or item.get('body')
+    payload = json.dumps([item.get('title'), item.get('handle'), body, bool(published)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _parse_iso_datetime(value):
+    """Parse a Shopify ISO timestamp (e.g. 2025-01-01T00:00:00Z); non-strings pass through, bad strings become None"""
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    return value
+
+def _id_array(ids):
+    """ids bound as one text[] parameter for = ANY(...) / <> ALL(...) filters, instead of a literal IN list"""
+    return literal([str(i) for i in ids], ARRAY(String))
+
+def _is_distinct(column, value):
+    """NULL-safe inequality; JSON has no equality operator in Postgres so compare its text form"""
+    if isinstance(column.type, JSON):
+        return cast(column, Text).is_distinct_from(cast(value, Text))
+    return column.is_distinct_from(value)
+
+class ShopLocks:
+    """Keyed in-process locks so writes are serialized per shop_domain instead of globally.
+    Entries are dropped once no thread holds or waits on them."""
+    def __init__(self):
+        self._guard = Lock()
+        self._locks = {}  # shop_domain -> [Lock, holders + waiters]
+
+    @contextmanager
+    def hold(self, shop_domain):
+        with self._guard:
+            entry = self._locks.setdefault(shop_domain, [Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[shop_domain]
+
+class ShopCache:
+    """In-process LRU/TTL cache of shop records (the get_shop dicts), keyed by shop_domain with
+    secondary company_id and email indexes. Only found shops are cached."""
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = Lock()
+        self._entries = OrderedDict()  # shop_domain -> (expires_at, shop_data), most recently used last
+        self._keys = {'company_id': {}, 'email': {}}  # field -> value -> shop_domain
+        self._generation = 0  # bumped on every invalidation
+
+    def generation(self):
+        """Take before reading the DB and pass to put(), so a read that raced a write is not cached"""
+        with self._lock:
+            return self._generation
+
+    def get(self, shop_domain):
+        with self._lock:
+            entry = self._entries.get(shop_domain)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._drop(shop_domain)
+                return None
+            self._entries.move_to_end(shop_domain)
+            return dict(entry[1])
+
+    def get_by(self, field, value):
+        """Cached shop whose `field` ('company_id' or 'email') equals value, or None"""
+        with self._lock:
+            shop_domain = self._keys[field].get(value)
+        if shop_domain is None:
+            return None
+        shop_data = self.get(shop_domain)
+        if shop_data and shop_data.get(field) == value:
+            return shop_data
+        return None
+
+    def put(self, shop_data, generation):
+        if not shop_data:
+            return
+        shop_domain = shop_data['shop_domain']
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._drop(shop_domain)
+            self._entries[shop_domain] = (time.monotonic() + self.ttl, dict(shop_data))
+            for field, index in self._keys.items():
+                if shop_data.get(field):
+                    index[shop_data[field]] = shop_domain
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, shop_domain):
+        with self._lock:
+            self._generation += 1
+            self._drop(shop_domain)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            for index in self._keys.values():
+                index.clear()
+
+    def _drop(self, shop_domain):
+        entry = self._entries.pop(shop_domain, None)
+        if entry is None:
+            return
+        for field, index in self._keys.items():
+            value = entry[1].get(field)
+            if value and index.get(value) == shop_domain:
+                del index[value]
+
+def _shop_to_dict(shop):
+    # Convert to dictionary to match original interface
+    return {
+        'shop_domain': shop.shop_domain,
+        'shop_id': shop.shop_id,
+        'shop_name': shop.shop_name,
+        'email': shop.email,
+        'access_token': shop.access_token,
+        'store_url': shop.store_url,
+        'company_id': shop.company_id,
+        'script_id': shop.script_id,
+        'status': shop.status,
+        'initial_sync_completed': shop.initial_sync_completed,
+        'created_at': shop.created_at.isoformat() if shop.created_at else None,
+        'updated_at': shop.updated_at.isoformat() if shop.updated_at else None
+    }
 
 # Enhanced SQLAlchemy database with table-like structure
 class ShopifyAppDatabase:
     def __init__(self):
-        self.lock = Lock()
+        # Reads run lock-free on pooled sessions; writes are serialized per shop only
+        self.shop_locks = ShopLocks()
+        # Shop records are cached per process; writers NOTIFY SHOP_CACHE_CHANNEL so every process drops its copy
+        self.shop_cache = ShopCache(max_size=SHOP_CACHE_SIZE, ttl=SHOP_CACHE_TTL)
+        self._listener = None
+        # Other per-process caches keyed by shop_domain, called with the shop (or None for all) on invalidation
+        self._shop_change_callbacks = []
+        # shop_domain -> (dictionary bytes or None, loaded_at); dictionaries never change once written
+        self._body_dictionaries = {}
         self._setup_database()
 
     def _setup_database(self):
@@ -116,6 +437,7 @@ class ShopifyAppDatabase:
             
             # Create tables
             Base.metadata.create_all(self.engine)
+            self._run_migrations()
             
             # Create session factory
             self.SessionFactory = scoped_session(sessionmaker(bind=self.engine))
@@ -126,13 +448,102 @@ class ShopifyAppDatabase:
             logger.error(f"Database setup failed: {str(e)}")
             raise
 
+    def _run_migrations(self, lock_poll_interval=1.0):
+        """Apply pending MIGRATIONS. Runs in autocommit mode because CREATE INDEX CONCURRENTLY cannot
+        run inside a transaction; a concurrent build that failed leaves an INVALID index, which is
+        dropped and rebuilt.
+
+        Other processes wait for the migration lock by polling pg_try_advisory_lock between short
+        statements: a blocking pg_advisory_lock call would hold a snapshot that CREATE INDEX
+        CONCURRENTLY in the lock holder waits for, deadlocking the two."""
+        with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            waiting = False
+            while not conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {'id': MIGRATION_LOCK_ID}).scalar():
+                if not waiting:
+                    logger.info("Waiting for another process to finish migrations")
+                    waiting = True
+                time.sleep(lock_poll_interval)
+            try:
+                applied = {row[0] for row in conn.execute(text("SELECT id FROM schema_migrations"))}
+                for migration_id, statement in MIGRATIONS:
+                    if migration_id in applied:
+                        continue
+                    if 'CONCURRENTLY' in statement:
+                        invalid = conn.execute(text(
+                            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                            "WHERE c.relname = :name AND NOT i.indisvalid"
+                        ), {'name': migration_id}).first()
+                        if invalid:
+                            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {migration_id}"))
+                    logger.info(f"Applying migration {migration_id}")
+                    conn.execute(text(statement))
+                    conn.execute(text("INSERT INTO schema_migrations (id, applied_at) VALUES (:id, :at)"),
+                                 {'id': migration_id, 'at': datetime.utcnow()})
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {'id': MIGRATION_LOCK_ID})
+
     def _get_session(self):
         """Get database session"""
         return self.SessionFactory()
 
-    def create_or_update_shop(self, shop_domain, **kwargs):
-        """Create or update shop record with all details"""
-        with self.lock:
+    def _notify_shop_changed(self, session, shop_domain):
+        """Queue a cache invalidation for shop_domain; Postgres delivers it to listeners when the session commits"""
+        session.execute(text("SELECT pg_notify(:channel, :shop_domain)"), {'channel': SHOP_CACHE_CHANNEL, 'shop_domain': shop_domain})
+
+    def _invalidate_shop(self, shop_domain):
+        self.shop_cache.invalidate(shop_domain)
+        for callback in self._shop_change_callbacks:
+            callback(shop_domain)
+
+    def _clear_shop_caches(self):
+        self.shop_cache.clear()
+        for callback in self._shop_change_callbacks:
+            callback(None)
+
+    def listen_for_shop_changes(self, callback):
+        """Call callback(shop_domain) whenever any process changes that shop's record or subscriptions,
+        and callback(None) when notifications may have been missed. Starts the listener if needed."""
+        if callback not in self._shop_change_callbacks:
+            self._shop_change_callbacks.append(callback)
+        self._start_cache_listener()
+
+    def _start_cache_listener(self):
+        if self._listener is None or not self._listener.is_alive():
+            self._listener = threading.Thread(target=self._listen_for_invalidations, name='shop-cache-listener', daemon=True)
+            self._listener.start()
+
+    def _listen_for_invalidations(self):
+        """LISTEN on a dedicated connection and drop shops changed by other processes from the cache"""
+        while True:
+            raw = None
+            try:
+                raw = self.engine.raw_connection()
+                raw.detach()  # autocommit LISTEN connection must not go back to the pool
+                conn = getattr(raw, 'dbapi_connection', None) or raw.connection
+                conn.set_isolation_level(0)
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {SHOP_CACHE_CHANNEL}")
+                # Anything cached before LISTEN took effect may have missed a notification
+                self._clear_shop_caches()
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._invalidate_shop(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.error(f"Shop cache listener failed, retrying: {str(e)}")
+                self._clear_shop_caches()
+                try:
+                    if raw is not None:
+                        raw.close()
+                except Exception:
+                    pass
+                time.sleep(5)
+
+    def create_or_update_shop(self, shop_domain, outbox=None, **kwargs):
+        """Create or update shop record with all details. outbox: (kind, payload) messages committed with it."""
+        with self.shop_locks.hold(shop_domain):
             session = self._get_session()
             try:
                 # Get or create shop
@@ -154,8 +565,11 @@ class ShopifyAppDatabase:
                         setattr(shop, key, value)
                 
                 shop.updated_at = datetime.now()
+                self._add_outbox(session, shop_domain, outbox)
                 
+                self._notify_shop_changed(session, shop_domain)
                 session.commit()
+                self._invalidate_shop(shop_domain)
                 logger.info(f"Updated shop record for {shop_domain}: {kwargs}")
                 return True
                 
@@ -168,118 +582,84 @@ class ShopifyAppDatabase:
 
     def get_shop(self, shop_domain):
         """Get complete shop record"""
-        with self.lock:
-            session = self._get_session()
-            try:
-                shop = session.query(Shop).filter_by(shop_domain=shop_domain).first()
-                
-                if shop:
-                    # Convert to dictionary to match original interface
-                    shop_data = {
-                        'shop_domain': shop.shop_domain,
-                        'shop_id': shop.shop_id,
-                        'shop_name': shop.shop_name,
-                        'email': shop.email,
-                        'access_token': shop.access_token,
-                        'store_url': shop.store_url,
-                        'company_id': shop.company_id,
-                        'script_id': shop.script_id,
-                        'status': shop.status,
-                        'initial_sync_completed': shop.initial_sync_completed,
-                        'created_at': shop.created_at.isoformat() if shop.created_at else None,
-                        'updated_at': shop.updated_at.isoformat() if shop.updated_at else None
-                    }
-                else:
-                    shop_data = {}
-                
-                logger.info(f"Retrieved shop data for {shop_domain}: {bool(shop_data)}")
-                return shop_data
-                
-            except Exception as e:
-                logger.error(f"Error retrieving shop {shop_domain}: {str(e)}")
-                return {}
-            finally:
-                session.close()
+        shop_data = self.shop_cache.get(shop_domain)
+        if shop_data is not None:
+            return shop_data
+        generation = self.shop_cache.generation()
+
+        session = self._get_session()
+        try:
+            shop = session.query(Shop).filter_by(shop_domain=shop_domain).first()
+            shop_data = _shop_to_dict(shop) if shop else {}
+            self._cache_shop(shop_data, generation)
+            
+            logger.info(f"Retrieved shop data for {shop_domain}: {bool(shop_data)}")
+            return shop_data
+            
+        except Exception as e:
+            logger.error(f"Error retrieving shop {shop_domain}: {str(e)}")
+            return {}
+        finally:
+            session.close()
 
     def get_shop_by_company_id(self, company_id):
         """Get shop record by company_id"""
-        with self.lock:
-            session = self._get_session()
-            try:
-                shop = session.query(Shop).filter_by(company_id=company_id).first()
-                
-                if shop:
-                    # Convert to dictionary to match original interface
-                    shop_data = {
-                        'shop_domain': shop.shop_domain,
-                        'shop_id': shop.shop_id,
-                        'shop_name': shop.shop_name,
-                        'email': shop.email,
-                        'access_token': shop.access_token,
-                        'store_url': shop.store_url,
-                        'company_id': shop.company_id,
-                        'script_id': shop.script_id,
-                        'status': shop.status,
-                        'initial_sync_completed': shop.initial_sync_completed,
-                        'created_at': shop.created_at.isoformat() if shop.created_at else None,
-                        'updated_at': shop.updated_at.isoformat() if shop.updated_at else None
-                    }
-                else:
-                    shop_data = {}
-                
-                logger.info(f"Retrieved shop data by company_id {company_id}: {bool(shop_data)}")
-                return shop_data
-                
-            except Exception as e:
-                logger.error(f"Error retrieving shop by company_id {company_id}: {str(e)}")
-                return {}
-            finally:
-                session.close()
+        shop_data = self.shop_cache.get_by('company_id', company_id)
+        if shop_data is not None:
+            return shop_data
+        generation = self.shop_cache.generation()
+
+        session = self._get_session()
+        try:
+            shop = session.query(Shop).filter_by(company_id=company_id).first()
+            shop_data = _shop_to_dict(shop) if shop else {}
+            self._cache_shop(shop_data, generation)
+            
+            logger.info(f"Retrieved shop data by company_id {company_id}: {bool(shop_data)}")
+            return shop_data
+            
+        except Exception as e:
+            logger.error(f"Error retrieving shop by company_id {company_id}: {str(e)}")
+            return {}
+        finally:
+            session.close()
 
     def get_shop_by_email(self, email, exclude_shop_domain=None):
         """Get shop record by email, optionally excluding a specific shop domain"""
-        with self.lock:
-            session = self._get_session()
-            try:
-                query = session.query(Shop).filter_by(email=email)
-                
-                # Exclude the current shop if specified
-                if exclude_shop_domain:
-                    query = query.filter(Shop.shop_domain != exclude_shop_domain)
-                
-                shop = query.first()
-                
-                if shop:
-                    # Convert to dictionary to match original interface
-                    shop_data = {
-                        'shop_domain': shop.shop_domain,
-                        'shop_id': shop.shop_id,
-                        'shop_name': shop.shop_name,
-                        'email': shop.email,
-                        'access_token': shop.access_token,
-                        'store_url': shop.store_url,
-                        'company_id': shop.company_id,
-                        'script_id': shop.script_id,
-                        'status': shop.status,
-                        'initial_sync_completed': shop.initial_sync_completed,
-                        'created_at': shop.created_at.isoformat() if shop.created_at else None,
-                        'updated_at': shop.updated_at.isoformat() if shop.updated_at else None
-                    }
-                else:
-                    shop_data = {}
-                
-                logger.info(f"Retrieved shop data by email {email} (excluding {exclude_shop_domain}): {bool(shop_data)}")
-                return shop_data
-                
-            except Exception as e:
-                logger.error(f"Error retrieving shop by email {email}: {str(e)}")
-                return {}
-            finally:
-                session.close()
+        shop_data = self.shop_cache.get_by('email', email)
+        if shop_data is not None and shop_data['shop_domain'] != exclude_shop_domain:
+            return shop_data
+        generation = self.shop_cache.generation()
+
+        session = self._get_session()
+        try:
+            query = session.query(Shop).filter_by(email=email)
+            
+            # Exclude the current shop if specified
+            if exclude_shop_domain:
+                query = query.filter(Shop.shop_domain != exclude_shop_domain)
+            
+            shop = query.first()
+            shop_data = _shop_to_dict(shop) if shop else {}
+            self._cache_shop(shop_data, generation)
+            
+            logger.info(f"Retrieved shop data by email {email} (excluding {exclude_shop_domain}): {bool(shop_data)}")
+            return shop_data
+            
+        except Exception as e:
+            logger.error(f"Error retrieving shop by email {email}: {str(e)}")
+            return {}
+        finally:
+            session.close()
 
-    def create_or_update_subscription(self, shop_domain, subscription_data):
-        """Create or update subscription record"""
-        with self.lock:
+    def _cache_shop(self, shop_data, generation):
+        if shop_data:
+            self._start_cache_listener()
+            self.shop_cache.put(shop_data, generation)
+
+    def create_or_update_subscription(self, shop_domain, subscription_data, outbox=None):
+        """Create or update subscription record. outbox: (kind, payload) messages committed with it."""
+        with self.shop_locks.hold(shop_domain):
             session = self._get_session()
             try:
                 subscription_id = subscription_data.get('id', 'unknown')
@@ -316,8 +696,11 @@ class ShopifyAppDatabase:
                     subscription.created_at = datetime.now()
                 
                 subscription.updated_at = datetime.now()
+                self._add_outbox(session, shop_domain, outbox)
                 
+                self._notify_shop_changed(session, shop_domain)
                 session.commit()
+                self._invalidate_shop(shop_domain)
                 logger.info(f"Updated subscription for {shop_domain}: {subscription_data}")
                 return True
                 
@@ -330,43 +713,44 @@ class ShopifyAppDatabase:
 
     def get_active_subscription(self, shop_domain):
         """Get active subscription for a shop"""
-        with self.lock:
-            session = self._get_session()
-            try:
-                subscription = session.query(Subscription).filter_by(
-                    shop_domain=shop_domain,
-                    status='ACTIVE'
-                ).first()
-                
-                if subscription:
-                    return {
-                        'subscription_id': subscription.subscription_id,
-                        'shop_domain': subscription.shop_domain,
-                        'name': subscription.name,
-                        'status': subscription.status,
-                        'interval': subscription.interval,
-                        'price': subscription.price,
-                        'created_at': subscription.created_at.isoformat() if subscription.created_at else None,
-                        'updated_at': subscription.updated_at.isoformat() if subscription.updated_at else None
-                    }
-                
-                return None
-                
-            except Exception as e:
-                logger.error(f"Error getting active subscription for {shop_domain}: {str(e)}")
-                return None
-            finally:
-                session.close()
+        session = self._get_session()
+        try:
+            subscription = session.query(Subscription).filter_by(
+                shop_domain=shop_domain,
+                status='ACTIVE'
+            ).first()
+            
+            if subscription:
+                return {
+                    'subscription_id': subscription.subscription_id,
+                    'shop_domain': subscription.shop_domain,
+                    'name': subscription.name,
+                    'status': subscription.status,
+                    'interval': subscription.interval,
+                    'price': subscription.price,
+                    'created_at': subscription.created_at.isoformat() if subscription.created_at else None,
+                    'updated_at': subscription.updated_at.isoformat() if subscription.updated_at else None
+                }
+            
+            return None
+            
+        except Exception as e:
+            logger.error(f"Error getting active subscription for {shop_domain}: {str(e)}")
+            return None
+        finally:
+            session.close()
 
     def delete_shop_and_subscriptions(self, shop_domain):
         """Delete a shop and all related subscriptions by shop_domain"""
-        with self.lock:
+        with self.shop_locks.hold(shop_domain):
             session = self._get_session()
             try:
                 # Delete related subscriptions first due to potential FK constraints
                 session.query(Subscription).filter_by(shop_domain=shop_domain).delete(synchronize_session=False)
                 session.query(Shop).filter_by(shop_domain=shop_domain).delete(synchronize_session=False)
+                self._notify_shop_changed(session, shop_domain)
                 session.commit()
+                self._invalidate_shop(shop_domain)
                 logger.info(f"Deleted shop and subscriptions for {shop_domain}")
                 return True
             except Exception as e:
@@ -376,100 +760,330 @@ class ShopifyAppDatabase:
             finally:
                 session.close()
 
-    def save_pages(self, shop_domain, pages, company_id=None, sync_time=None):
-        """Upsert pages for a shop. Pages items may contain keys: id, title, handle, body or body_html, created_at, updated_at, store_id, chunk_ids"""
-        with self.lock:
+    def _lock_content_stats(self, session, shop_domain):
+        """Lock the shop's shop_content_stats row for this transaction, creating it from the real
+        table counts the first time. Call before changing pages1/articles so the counts match."""
+        exists = session.query(ShopContentStats.shop_domain).filter_by(shop_domain=shop_domain).with_for_update().first()
+        if exists is None:
+            pages_count = session.query(func.count(Page.id)).filter(Page.shop_domain == shop_domain).scalar_subquery()
+            articles_count = session.query(func.count(Article.id)).filter(Article.shop_domain == shop_domain).scalar_subquery()
+            session.execute(pg_insert(ShopContentStats).values(
+                shop_domain=shop_domain,
+                pages_count=pages_count,
+                articles_count=articles_count,
+                pages_last_sync_time=session.query(func.max(Page.last_sync_time)).filter(Page.shop_domain == shop_domain).scalar_subquery(),
+                articles_last_sync_time=session.query(func.max(Article.last_sync_time)).filter(Article.shop_domain == shop_domain).scalar_subquery(),
+                updated_at=datetime.utcnow()
+            ).on_conflict_do_nothing(index_elements=['shop_domain']))
+            session.query(ShopContentStats.shop_domain).filter_by(shop_domain=shop_domain).with_for_update().first()
+
+    def _bump_content_stats(self, session, model, shop_domain, delta=0, sync_time=None):
+        """Apply a page/article count change (and sync time) to the row locked by _lock_content_stats"""
+        prefix = 'pages' if model is Page else 'articles'
+        values = {f'{prefix}_count': getattr(ShopContentStats, f'{prefix}_count') + delta, 'updated_at': datetime.utcnow()}
+        if sync_time is not None:
+            values[f'{prefix}_last_sync_time'] = sync_time
+        session.query(ShopContentStats).filter_by(shop_domain=shop_domain).update(values, synchronize_session=False)
+
+    def _get_content_stats(self, shop_domain):
+        session = self._get_session()
+        try:
+            return session.get(ShopContentStats, shop_domain)
+        finally:
+            session.close()
+
+    def get_sync_watermark(self, shop_domain, resource):
+        """{'watermark', 'full_sync_at'} for the shop's 'pages' or 'articles'; both None if never recorded"""
+        stats = self._get_content_stats(shop_domain)
+        return {
+            'watermark': getattr(stats, f'{resource}_watermark', None),
+            'full_sync_at': getattr(stats, f'{resource}_full_sync_at', None),
+        }
+
+    def set_sync_watermark(self, shop_domain, resource, watermark=None, full_sync_at=None):
+        """Record a completed sync listing of 'pages' or 'articles'. The watermark only moves forward.
+        Returns True on success."""
+        values = {ShopContentStats.updated_at: datetime.utcnow()}
+        if watermark is not None:
+            column = getattr(ShopContentStats, f'{resource}_watermark')
+            values[column] = func.greatest(column, watermark)  # GREATEST ignores NULL
+        if full_sync_at is not None:
+            values[getattr(ShopContentStats, f'{resource}_full_sync_at')] = full_sync_at
+        with self.shop_locks.hold(shop_domain):
             session = self._get_session()
             try:
-                for page in pages:
-                    page_id = str(page.get('id'))
-                    existing = session.query(Page).filter_by(id=page_id).first()
-                    if not existing:
-                        existing = Page(id=page_id, shop_domain=shop_domain)
-                        session.add(existing)
-
-                    existing.title = page.get('title')
-                    existing.handle = page.get('handle')
-                    # accept either key
-                    existing.body_html = page.get('body_html') or page.get('body')
-
-                    created_at_val = page.get('created_at')
-                    updated_at_val = page.get('updated_at')
-
-                    if isinstance(created_at_val, str):
-                        try:
-                            created_at_val = datetime.fromisoformat(created_at_val.replace('Z', '+00:00'))
-                        except:
-                            created_at_val = None
-                    if isinstance(updated_at_val, str):
-                        try:
-                            updated_at_val = datetime.fromisoformat(updated_at_val.replace('Z', '+00:00'))
-                        except:
-                            updated_at_val = None
-
-                    existing.created_at = created_at_val
-                    existing.updated_at = updated_at_val
-                    existing.store_id = page.get('store_id')
-                    existing.company_id = page.get('company_id') or company_id
-                    existing.last_sync_time = sync_time or datetime.utcnow()
-                    # default chunk_ids to [] if not provided
-                    chunk_ids_value = page.get('chunk_ids')
-                    if chunk_ids_value is None and existing.chunk_ids is None:
-                        chunk_ids_value = []
-                    if chunk_ids_value is not None:
-                        existing.chunk_ids = chunk_ids_value
-                    # published fields
-                    published_at_val = page.get('published_at')
-                    if isinstance(published_at_val, str):
-                        try:
-                            published_at_val = datetime.fromisoformat(published_at_val.replace('Z', '+00:00'))
-                        except:
-                            published_at_val = None
-                    existing.published_at = published_at_val
-                    if page.get('published') is not None:
-                        existing.published = bool(page.get('published'))
-                    elif published_at_val is not None:
-                        existing.published = True
-
+                self._lock_content_stats(session, shop_domain)
+                session.query(ShopContentStats).filter_by(shop_domain=shop_domain).update(values, synchronize_session=False)
                 session.commit()
-                logger.info(f"Saved/updated {len(pages)} pages for {shop_domain}")
                 return True
             except Exception as e:
                 session.rollback()
-                logger.error(f"Error saving pages for {shop_domain}: {str(e)}")
+                logger.error(f"Error saving {resource} sync watermark for {shop_domain}: {str(e)}")
                 return False
             finally:
                 session.close()
 
-    def get_page_ids_for_shop(self, shop_domain):
-        with self.lock:
+    def _bulk_upsert_content(self, session, model, shop_domain, items, company_id=None, sync_time=None):
+        """Upsert Page/Article rows with multi-row INSERT ... ON CONFLICT (id) DO UPDATE statements.
+
+        Field semantics match the old per-row ORM loop: chunk_ids are kept when the item has none
+        (defaulting to []), published falls back to bool(published_at) and then to the stored value,
+        and last_sync_time is bumped on every row. Rows whose stored values already match are not
+        rewritten. shop_content_stats is updated in the same transaction. Returns a dict with
+        'inserted', 'updated' and 'unchanged' counts.
+        """
+        table = model.__table__
+        last_sync_time = sync_time or datetime.utcnow()
+        stats = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        self._lock_content_stats(session, shop_domain)
+        zdict = self.get_body_dictionary(shop_domain, session=session)
+
+        # Last occurrence wins; ON CONFLICT cannot touch the same row twice in one statement
+        rows = {}
+        for item in items:
+            row_id = str(item.get('id'))
+            published_at_val = _parse_iso_datetime(item.get('published_at'))
+            if item.get('published') is not None:
+                published = bool(item.get('published'))
+            elif published_at_val is not None:
+                published = True
+            else:
+                published = None
+            rows[row_id] = {
+                'id': row_id,
+                'shop_domain': shop_domain,
+                'title': item.get('title'),
+                'handle': item.get('handle'),
+                # accept either key; stored compressed, the legacy text column is cleared
+                'body_html': None,
+                'body_compressed': encode_body(item.get('body_html') or item.get('body'), zdict=zdict),
+                'created_at': _parse_iso_datetime(item.get('created_at')),
+                'updated_at': _parse_iso_datetime(item.get('updated_at')),
+                'store_id': item.get('store_id'),
+                'company_id': item.get('company_id') or company_id,
+                'last_sync_time': last_sync_time,
+                'chunk_ids': item.get('chunk_ids'),
+                'published': published,
+                'published_at': published_at_val,
+                'content_hash': content_fingerprint(item),
+            }
+        if not rows:
+            return stats
+
+        # One statement per combination of optional fields the caller supplied (at most four)
+        groups = {}
+        for row in rows.values():
+            key = (row['chunk_ids'] is not None, row['published'] is not None)
+            groups.setdefault(key, []).append(row)
+
+        written_ids = set()
+        for (has_chunk_ids, has_published), group in groups.items():
+            for row in group:
+                if not has_chunk_ids:
+                    row['chunk_ids'] = []
+                if not has_published:
+                    row['published'] = True
+
+            stmt = pg_insert(table).values(group)
+            excluded = stmt.excluded
+            set_ = {name: excluded[name] for name in CONTENT_UPSERT_COLUMNS}
+            if has_chunk_ids:
+                set_['chunk_ids'] = excluded.chunk_ids
+            else:
+                set_['chunk_ids'] = func.coalesce(table.c.chunk_ids, excluded.chunk_ids)
+            if has_published:
+                set_['published'] = excluded.published
+            changed = or_(*[_is_distinct(table.c[name], value) for name, value in set_.items()])
+            set_['last_sync_time'] = excluded.last_sync_time
+
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.id],
+                set_=set_,
+                where=changed
+            ).returning(table.c.id, literal_column('xmax = 0').label('inserted'))
+
+            for row_id, inserted in session.execute(stmt):
+                written_ids.add(row_id)
+                stats['inserted' if inserted else 'updated'] += 1
+
+        unchanged_ids = [row_id for row_id in rows if row_id not in written_ids]
+        if unchanged_ids:
+            session.execute(
+                table.update().where(table.c.id.in_(unchanged_ids)).values(last_sync_time=last_sync_time)
+            )
+        stats['unchanged'] = len(unchanged_ids)
+        self._bump_content_stats(session, model, shop_domain, delta=stats['inserted'], sync_time=last_sync_time)
+        return stats
+
+    def save_pages(self, shop_domain, pages, company_id=None, sync_time=None, outbox=None):
+        """Upsert pages for a shop. Pages items may contain keys: id, title, handle, body or body_html, created_at, updated_at, store_id, chunk_ids.
+        outbox: (kind, payload) messages committed with the rows. Returns {'inserted', 'updated', 'unchanged'} counts, or False on error."""
+        with self.shop_locks.hold(shop_domain):
             session = self._get_session()
             try:
-                return [row.id for row in session.query(Page.id).filter_by(shop_domain=shop_domain).all()]
+                stats = self._bulk_upsert_content(session, Page, shop_domain, pages, company_id=company_id, sync_time=sync_time)
+                self._add_outbox(session, shop_domain, outbox)
+                session.commit()
+                logger.info(f"Saved/updated {len(pages)} pages for {shop_domain}: {stats}")
+                return stats
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Error saving pages for {shop_domain}: {str(e)}")
+                return False
             finally:
                 session.close()
 
+    def _get_stored_content(self, model, shop_domain, ids=None, with_body=False):
+        """Page/Article rows of a shop as dicts. Bodies are deferred on the models and are only
+        fetched, decompressed and included as body_html when with_body=True. Returns None if the
+        rows could not be loaded, so callers can tell an error from ids that no longer exist."""
+        session = self._get_session()
+        try:
+            query = session.query(model).filter(model.shop_domain == shop_domain)
+            if ids is not None:
+                query = query.filter(model.id == any_(_id_array(ids)))
+            if with_body:
+                query = query.options(undefer_group('body'))
+            items = []
+            for row in query:
+                item = {
+                    'id': row.id,
+                    'title': row.title,
+                    'handle': row.handle,
+                    'created_at': row.created_at.isoformat() if row.created_at else None,
+                    'updated_at': row.updated_at.isoformat() if row.updated_at else None,
+                    'published_at': row.published_at.isoformat() if row.published_at else None,
+                    'published': row.published,
+                    'store_id': row.store_id,
+                    'company_id': row.company_id,
+                    'chunk_ids': row.chunk_ids,
+                    'content_hash': row.content_hash
+                }
+                if with_body:
+                    item['body_html'] = row.body_html
+                items.append(item)
+            return items
+        except Exception as e:
+            logger.error(f"Error loading stored {model.__tablename__} for {shop_domain}: {str(e)}")
+            return None
+        finally:
+            session.close()
+
+    def get_stored_pages(self, shop_domain, ids=None, with_body=False):
+        """Stored pages of a shop (optionally only `ids`); bodies are loaded only with with_body=True. None on error."""
+        return self._get_stored_content(Page, shop_domain, ids=ids, with_body=with_body)
+
+    def get_stored_articles(self, shop_domain, ids=None, with_body=False):
+        """Stored articles of a shop (optionally only `ids`); bodies are loaded only with with_body=True. None on error."""
+        return self._get_stored_content(Article, shop_domain, ids=ids, with_body=with_body)
+
+    def get_body_dictionary(self, shop_domain, required=False, negative_ttl=300, session=None):
+        """The shop's body compression dictionary, or None if it has none. A missing dictionary is
+        remembered for negative_ttl seconds; required=True (decoding a body that used one) always rechecks.
+        A lookup runs in the caller's session if given (left open), otherwise on a connection of its
+        own, so the thread's scoped session is never closed under a caller that is still using it."""
+        cached = self._body_dictionaries.get(shop_domain)
+        if cached and (cached[0] is not None or (not required and time.monotonic() - cached[1] < negative_ttl)):
+            return cached[0]
+        query = sa_select(ShopBodyDictionary.data).where(ShopBodyDictionary.shop_domain == shop_domain)
+        if session is not None:
+            with session.no_autoflush:
+                stored = session.execute(query).scalar()
+        else:
+            with self.engine.connect() as conn:
+                stored = conn.execute(query).scalar()
+        data = bytes(stored) if stored is not None else None
+        self._body_dictionaries[shop_domain] = (data, time.monotonic())
+        return data
+
+    def create_body_dictionary(self, shop_domain, sample_size=200, min_samples=10):
+        """Build the shop's compression dictionary from up to sample_size stored bodies. Does nothing if
+        the shop already has one or has fewer than min_samples bodies. Returns the dictionary or None."""
+        existing = self.get_body_dictionary(shop_domain, required=True)
+        if existing:
+            return existing
+        session = self._get_session()
+        try:
+            samples = []
+            for model in (Page, Article):
+                rows = session.query(model).options(undefer_group('body')).filter(model.shop_domain == shop_domain).limit(sample_size - len(samples))
+                samples.extend(row.body_html for row in rows if row.body_html)
+            if len(samples) < min_samples:
+                return None
+            data = build_raw_dictionary(samples)
+            if not data:
+                return None
+            session.execute(
+                pg_insert(ShopBodyDictionary.__table__)
+                .values(shop_domain=shop_domain, data=data, sample_count=len(samples), created_at=datetime.utcnow())
+                .on_conflict_do_nothing(index_elements=['shop_domain'])
+            )
+            session.commit()
+            logger.info(f"Created {len(data)} byte body dictionary for {shop_domain} from {len(samples)} samples")
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error creating body dictionary for {shop_domain}: {str(e)}")
+            return None
+        finally:
+            session.close()
+        # Another process may have won the insert; use whichever dictionary is stored
+        return self.get_body_dictionary(shop_domain, required=True)
+
+    def recompress_bodies(self, shop_domain, batch_size=200):
+        """Rewrite the shop's bodies that are still plain text or not using its current dictionary.
+        Returns the number of rows rewritten."""
+        zdict = self.get_body_dictionary(shop_domain)
+        rewritten = 0
+        for model in (Page, Article):
+            with self.shop_locks.hold(shop_domain):
+                session = self._get_session()
+                try:
+                    rows = session.query(model).options(undefer_group('body')).filter(model.shop_domain == shop_domain).yield_per(batch_size)
+                    count = 0
+                    for row in rows:
+                        if row.body_compressed is not None and (body_uses_dictionary(row.body_compressed) or not zdict):
+                            continue
+                        row.body_html = row.body_html
+                        count += 1
+                    session.commit()
+                    rewritten += count
+                except Exception as e:
+                    session.rollback()
+                    logger.error(f"Error recompressing {model.__tablename__} bodies for {shop_domain}: {str(e)}")
+                finally:
+                    session.close()
+        return rewritten
+
+    def get_page_ids_for_shop(self, shop_domain):
+        session = self._get_session()
+        try:
+            return [row.id for row in session.query(Page.id).filter_by(shop_domain=shop_domain).all()]
+        finally:
+            session.close()
+
     def get_pages_meta_for_shop(self, shop_domain):
-        """Return a dict of page_id -> { 'updated_at': dt, 'chunk_ids': json }"""
-        with self.lock:
-            session = self._get_session()
-            try:
-                rows = session.query(Page.id, Page.updated_at, Page.chunk_ids).filter_by(shop_domain=shop_domain).all()
-                meta = {}
-                for pid, updated_at, chunk_ids in rows:
-                    meta[str(pid)] = {
-                        'updated_at': updated_at,
-                        'chunk_ids': chunk_ids,
-                    }
-                return meta
-            finally:
-                session.close()
+        """Return a dict of page_id -> { 'updated_at': dt, 'chunk_ids': json, 'content_hash': str }"""
+        session = self._get_session()
+        try:
+            rows = session.query(Page.id, Page.updated_at, Page.chunk_ids, Page.content_hash).filter_by(shop_domain=shop_domain).all()
+            meta = {}
+            for pid, updated_at, chunk_ids, content_hash in rows:
+                meta[str(pid)] = {
+                    'updated_at': updated_at,
+                    'chunk_ids': chunk_ids,
+                    'content_hash': content_hash,
+                }
+            return meta
+        finally:
+            session.close()
 
     def update_last_sync_time_for_ids(self, shop_domain, page_ids, sync_time):
-        with self.lock:
+        with self.shop_locks.hold(shop_domain):
             session = self._get_session()
             try:
+                self._lock_content_stats(session, shop_domain)
                 updated = session.query(Page).filter(Page.shop_domain == shop_domain, Page.id.in_(page_ids)).update({Page.last_sync_time: sync_time}, synchronize_session=False)
+                self._bump_content_stats(session, Page, shop_domain, sync_time=sync_time)
                 session.commit()
                 logger.info(f"Updated last_sync_time for {updated} pages for {shop_domain}")
                 return updated
@@ -482,87 +1096,62 @@ class ShopifyAppDatabase:
 
     def get_previous_pages_sync_time(self, shop_domain):
         """Return the most recent last_sync_time for any page of the shop, or None."""
-        with self.lock:
-            session = self._get_session()
-            try:
-                from sqlalchemy import func
-                result = session.query(func.max(Page.last_sync_time)).filter_by(shop_domain=shop_domain).scalar()
-                return result
-            finally:
-                session.close()
-    def delete_pages_not_in_ids(self, shop_domain, keep_ids):
-        with self.lock:
+        stats = self._get_content_stats(shop_domain)
+        if stats is not None and stats.pages_last_sync_time is not None:
+            return stats.pages_last_sync_time
+        session = self._get_session()
+        try:
+            return session.query(func.max(Page.last_sync_time)).filter_by(shop_domain=shop_domain).scalar()
+        finally:
+            session.close()
+    def _delete_content(self, model, shop_domain, ids=None, keep_ids=None, outbox=None):
+        """Delete the shop's rows whose id is in ids (= ANY) and/or not in keep_ids (<> ALL); each id
+        list is sent as a single array parameter"""
+        label = 'pages' if model is Page else 'articles'
+        if ids is not None and not ids:
+            return 0
+        with self.shop_locks.hold(shop_domain):
             session = self._get_session()
             try:
-                deleted = session.query(Page).filter(Page.shop_domain == shop_domain, ~Page.id.in_(keep_ids)).delete(synchronize_session=False)
+                self._lock_content_stats(session, shop_domain)
+                query = session.query(model).filter(model.shop_domain == shop_domain)
+                if ids is not None:
+                    query = query.filter(model.id == any_(_id_array(ids)))
+                if keep_ids is not None:
+                    query = query.filter(model.id != all_(_id_array(keep_ids)))
+                deleted = query.delete(synchronize_session=False)
+                self._bump_content_stats(session, model, shop_domain, delta=-deleted)
+                self._add_outbox(session, shop_domain, outbox)
                 session.commit()
-                logger.info(f"Deleted {deleted} pages for {shop_domain} not present in latest sync")
+                logger.info(f"Deleted {deleted} {label} for {shop_domain}")
                 return deleted
             except Exception as e:
                 session.rollback()
-                logger.error(f"Error deleting missing pages for {shop_domain}: {str(e)}")
+                logger.error(f"Error deleting missing {label} for {shop_domain}: {str(e)}")
                 return 0
             finally:
                 session.close()
 
-    def save_articles(self, shop_domain, articles, company_id=None, sync_time=None):
-        """Upsert articles for a shop. Articles items may contain keys: id, title, handle, body or body_html, created_at, updated_at, store_id, chunk_ids"""
-        with self.lock:
+    def delete_pages_by_ids(self, shop_domain, page_ids, outbox=None):
+        """Delete these pages of the shop. outbox: (kind, payload) messages committed with the delete.
+        Returns the count."""
+        return self._delete_content(Page, shop_domain, ids=page_ids, outbox=outbox)
+
+    def delete_pages_not_in_ids(self, shop_domain, keep_ids, outbox=None):
+        """Delete the shop's pages missing from keep_ids. Returns the count."""
+        return self._delete_content(Page, shop_domain, keep_ids=keep_ids, outbox=outbox)
+
+    def save_articles(self, shop_domain, articles, company_id=None, sync_time=None, outbox=None):
+        """Upsert articles for a shop. Articles items may contain keys: id, title, handle, body or body_html, created_at, updated_at, store_id, chunk_ids.
+        outbox: (kind, payload) messages committed with the rows. Returns {'inserted', 'updated', 'unchanged'} counts, or False on error."""
+        with self.shop_locks.hold(shop_domain):
             session = self._get_session()
             try:
-                for article in articles:
-                    article_id = str(article.get('id'))
-                    existing = session.query(Article).filter_by(id=article_id).first()
-                    if not existing:
-                        existing = Article(id=article_id, shop_domain=shop_domain)
-                        session.add(existing)
-
-                    existing.title = article.get('title')
-                    existing.handle = article.get('handle')
-                    # accept either key
-                    existing.body_html = article.get('body_html') or article.get('body')
-
-                    created_at_val = article.get('created_at')
-                    updated_at_val = article.get('updated_at')
-
-                    if isinstance(created_at_val, str):
-                        try:
-                            created_at_val = datetime.fromisoformat(created_at_val.replace('Z', '+00:00'))
-                        except:
-                            created_at_val = None
-                    if isinstance(updated_at_val, str):
-                        try:
-                            updated_at_val = datetime.fromisoformat(updated_at_val.replace('Z', '+00:00'))
-                        except:
-                            updated_at_val = None
-
-                    existing.created_at = created_at_val
-                    existing.updated_at = updated_at_val
-                    existing.store_id = article.get('store_id')
-                    existing.company_id = article.get('company_id') or company_id
-                    existing.last_sync_time = sync_time or datetime.utcnow()
-                    # default chunk_ids to [] if not provided
-                    chunk_ids_value = article.get('chunk_ids')
-                    if chunk_ids_value is None and existing.chunk_ids is None:
-                        chunk_ids_value = []
-                    if chunk_ids_value is not None:
-                        existing.chunk_ids = chunk_ids_value
-                    # published fields
-                    published_at_val = article.get('published_at')
-                    if isinstance(published_at_val, str):
-                        try:
-                            published_at_val = datetime.fromisoformat(published_at_val.replace('Z', '+00:00'))
-                        except:
-                            published_at_val = None
-                    existing.published_at = published_at_val
-                    if article.get('published') is not None:
-                        existing.published = bool(article.get('published'))
-                    elif published_at_val is not None:
-                        existing.published = True
-
+                stats = self._bulk_upsert_content(session, Article, shop_domain, articles, company_id=company_id, sync_time=sync_time)
+                self._add_outbox(session, shop_domain, outbox)
                 session.commit()
-                logger.info(f"Saved/updated {len(articles)} articles for {shop_domain}")
-                return True
+                logger.info(f"Saved/updated {len(articles)} articles for {shop_domain}: {stats}")
+                return stats
             except Exception as e:
                 session.rollback()
                 logger.error(f"Error saving articles for {shop_domain}: {str(e)}")
@@ -571,47 +1160,345 @@ class ShopifyAppDatabase:
                 session.close()
 
     def get_articles_meta_for_shop(self, shop_domain):
-        """Return a dict of article_id -> { 'updated_at': dt, 'chunk_ids': json }"""
-        with self.lock:
-            session = self._get_session()
-            try:
-                rows = session.query(Article.id, Article.updated_at, Article.chunk_ids).filter_by(shop_domain=shop_domain).all()
-                meta = {}
-                for aid, updated_at, chunk_ids in rows:
-                    meta[str(aid)] = {
-                        'updated_at': updated_at,
-                        'chunk_ids': chunk_ids,
-                    }
-                return meta
-            finally:
-                session.close()
-
-    def get_previous_articles_sync_time(self, shop_domain):
-        """Return the most recent last_sync_time for any article of the shop, or None."""
-        with self.lock:
-            session = self._get_session()
-            try:
-                from sqlalchemy import func
-                result = session.query(func.max(Article.last_sync_time)).filter_by(shop_domain=shop_domain).scalar()
-                return result
-            finally:
-                session.close()
+        """Return a dict of article_id -> { 'updated_at': dt, 'chunk_ids': json, 'content_hash': str }"""
+        session = self._get_session()
+        try:
+            rows = session.query(Article.id, Article.updated_at, Article.chunk_ids, Article.content_hash).filter_by(shop_domain=shop_domain).all()
+            meta = {}
+            for aid, updated_at, chunk_ids, content_hash in rows:
+                meta[str(aid)] = {
+                    'updated_at': updated_at,
+                    'chunk_ids': chunk_ids,
+                    'content_hash': content_hash,
+                }
+            return meta
+        finally:
+            session.close()
 
-    def delete_articles_not_in_ids(self, shop_domain, keep_ids):
-        with self.lock:
+    def update_articles_last_sync_time_for_ids(self, shop_domain, article_ids, sync_time):
+        with self.shop_locks.hold(shop_domain):
             session = self._get_session()
             try:
-                deleted = session.query(Article).filter(Article.shop_domain == shop_domain, ~Article.id.in_(keep_ids)).delete(synchronize_session=False)
+                self._lock_content_stats(session, shop_domain)
+                updated = session.query(Article).filter(Article.shop_domain == shop_domain, Article.id.in_(article_ids)).update({Article.last_sync_time: sync_time}, synchronize_session=False)
+                self._bump_content_stats(session, Article, shop_domain, sync_time=sync_time)
                 session.commit()
-                logger.info(f"Deleted {deleted} articles for {shop_domain} not present in latest sync")
-                return deleted
+                logger.info(f"Updated last_sync_time for {updated} articles for {shop_domain}")
+                return updated
             except Exception as e:
                 session.rollback()
-                logger.error(f"Error deleting missing articles for {shop_domain}: {str(e)}")
+                logger.error(f"Error updating articles last_sync_time for {shop_domain}: {str(e)}")
                 return 0
             finally:
                 session.close()
 
+    def get_previous_articles_sync_time(self, shop_domain):
+        """Return the most recent last_sync_time for any article of the shop, or None."""
+        stats = self._get_content_stats(shop_domain)
+        if stats is not None and stats.articles_last_sync_time is not None:
+            return stats.articles_last_sync_time
+        session = self._get_session()
+        try:
+            return session.query(func.max(Article.last_sync_time)).filter_by(shop_domain=shop_domain).scalar()
+        finally:
+            session.close()
+
+    def delete_articles_by_ids(self, shop_domain, article_ids, outbox=None):
+        """Delete these articles of the shop. outbox: (kind, payload) messages committed with the delete.
+        Returns the count."""
+        return self._delete_content(Article, shop_domain, ids=article_ids, outbox=outbox)
+
+    def delete_articles_not_in_ids(self, shop_domain, keep_ids, outbox=None):
+        """Delete the shop's articles missing from keep_ids. Returns the count."""
+        return self._delete_content(Article, shop_domain, keep_ids=keep_ids, outbox=outbox)
+
+    def queue_webhook(self, webhook_id, topic, shop_domain, payload, debounce=None, debounce_topics=None, max_wait=None):
+        """Persist a webhook delivery for the workers. Returns True if it was queued, False if
+        webhook_id was already accepted (a redelivery), and None if it could not be stored.
+
+        With debounce (seconds) the event waits that long, and every queued event of the shop in
+        debounce_topics is pushed back with it, so a burst is processed together once it goes quiet
+        (but never more than max_wait seconds after an event arrived)."""
+        session = self._get_session()
+        try:
+            now = datetime.utcnow()
+            process_after = now + timedelta(seconds=debounce) if debounce else now
+            inserted = session.execute(
+                pg_insert(WebhookDelivery.__table__)
+                .values(webhook_id=webhook_id, topic=topic, shop_domain=shop_domain, received_at=now,
+                        payload=payload, status='queued', attempts=0, process_after=process_after)
+                .on_conflict_do_nothing(index_elements=['webhook_id'])
+                .returning(WebhookDelivery.__table__.c.webhook_id)
+            ).first()
+            if inserted is not None and debounce and debounce_topics:
+                session.query(WebhookDelivery).filter(
+                    WebhookDelivery.shop_domain == shop_domain,
+                    WebhookDelivery.status == 'queued',
+                    WebhookDelivery.attempts == 0,
+                    WebhookDelivery.topic.in_(debounce_topics)
+                ).update({WebhookDelivery.process_after: func.least(
+                    process_after, WebhookDelivery.received_at + timedelta(seconds=max_wait or debounce)
+                )}, synchronize_session=False)
+            session.commit()
+            return inserted is not None
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error queueing webhook {webhook_id} ({topic}): {str(e)}")
+            return None
+        finally:
+            session.close()
+
+    def claim_webhook_events(self, limit=100, stale_after=300):
+        """Move up to `limit` due queued webhook events to 'processing' and return them oldest first.
+        Events stuck in 'processing' for stale_after seconds (a dead worker) are claimed again. An
+        event is held back while an older one of its shop is processing or waiting for a retry; claims
+        of a shop are serialized with an advisory lock, as in claim_outbox_messages."""
+        session = self._get_session()
+        try:
+            now = datetime.utcnow()
+            stale = now - timedelta(seconds=stale_after)
+            older = aliased(WebhookDelivery)
+            blocked = session.query(older.webhook_id).filter(
+                older.shop_domain == WebhookDelivery.shop_domain,
+                older.received_at < WebhookDelivery.received_at,
+                or_(
+                    (older.status == 'processing') & (older.claimed_at >= stale),
+                    # waiting for a retry; events merely debounced do not hold others back
+                    (older.status == 'queued') & (older.process_after > now) & (older.attempts > 0)
+                )
+            ).exists()
+            due = or_(
+                (WebhookDelivery.status == 'queued') & (WebhookDelivery.process_after <= now),
+                (WebhookDelivery.status == 'processing') & (WebhookDelivery.claimed_at < stale)
+            )
+            shops = (session.query(WebhookDelivery.shop_domain).filter(due).group_by(WebhookDelivery.shop_domain)
+                     .order_by(func.min(WebhookDelivery.received_at)).limit(limit).all())
+            events = []
+            for (shop_domain,) in shops:
+                if len(events) >= limit:
+                    break
+                if not self._try_claim_lock(session, WEBHOOK_CLAIM_LOCK_ID, shop_domain):
+                    continue  # another worker is claiming this shop's events
+                events.extend(session.query(WebhookDelivery).filter(WebhookDelivery.shop_domain == shop_domain, due, ~blocked)
+                              .order_by(WebhookDelivery.received_at).limit(limit - len(events)).with_for_update(skip_locked=True).all())
+            events.sort(key=lambda event: event.received_at)
+            claimed = []
+            for event in events:
+                event.status = 'processing'
+                event.attempts = (event.attempts or 0) + 1
+                event.claimed_at = now
+                claimed.append({
+                    'webhook_id': event.webhook_id,
+                    'topic': event.topic,
+                    'shop_domain': event.shop_domain,
+                    'payload': event.payload,
+                    'attempts': event.attempts,
+                    'received_at': event.received_at.isoformat() if event.received_at else None
+                })
+            session.commit()
+            return claimed
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error claiming webhook events: {str(e)}")
+            return []
+        finally:
+            session.close()
+
+    def finish_webhook_events(self, webhook_ids, status='done'):
+        """Mark events processed ('done') or superseded by a later one ('coalesced'), dropping their payloads"""
+        session = self._get_session()
+        try:
+            session.query(WebhookDelivery).filter(WebhookDelivery.webhook_id.in_(webhook_ids)).update(
+                {WebhookDelivery.status: status, WebhookDelivery.processed_at: datetime.utcnow(),
+                 WebhookDelivery.payload: None, WebhookDelivery.error: None}, synchronize_session=False)
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error finishing webhook events {webhook_ids}: {str(e)}")
+            return False
+        finally:
+            session.close()
+
+    def release_webhook_events(self, webhook_ids):
+        """Put claimed events back in the queue without counting the attempt"""
+        session = self._get_session()
+        try:
+            session.query(WebhookDelivery).filter(WebhookDelivery.webhook_id.in_(webhook_ids)).update(
+                {WebhookDelivery.status: 'queued', WebhookDelivery.attempts: WebhookDelivery.attempts - 1,
+                 WebhookDelivery.claimed_at: None}, synchronize_session=False)
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error releasing webhook events {webhook_ids}: {str(e)}")
+            return False
+        finally:
+            session.close()
+
+    def fail_webhook_event(self, webhook_id, error, retry_delay=None, max_attempts=5):
+        """Record a failed attempt. With retry_delay (seconds) the event is queued again if attempts remain, otherwise it is marked failed."""
+        session = self._get_session()
+        try:
+            event = session.get(WebhookDelivery, webhook_id)
+            if not event:
+                return False
+            event.error = error
+            if retry_delay is not None and event.attempts < max_attempts:
+                event.status = 'queued'
+                event.process_after = datetime.utcnow() + timedelta(seconds=retry_delay)
+            else:
+                event.status = 'failed'
+                event.processed_at = datetime.utcnow()
+            session.commit()
+            return event.status
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error recording failure of webhook {webhook_id}: {str(e)}")
+            return False
+        finally:
+            session.close()
+
+    def purge_webhook_deliveries(self, older_than):
+        """Delete finished deliveries received more than older_than seconds ago. Returns the count."""
+        session = self._get_session()
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=older_than)
+            deleted = session.query(WebhookDelivery).filter(
+                WebhookDelivery.received_at < cutoff,
+                or_(WebhookDelivery.status.in_(['done', 'coalesced', 'failed']), WebhookDelivery.status.is_(None))
+            ).delete(synchronize_session=False)
+            session.commit()
+            return deleted
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error purging webhook deliveries: {str(e)}")
+            return 0
+        finally:
+            session.close()
+
+    def _add_outbox(self, session, shop_domain, messages, max_attempts=OUTBOX_MAX_ATTEMPTS):
+        """Stage (kind, payload) outbox messages on the caller's session so they commit with its changes"""
+        for kind, payload in messages or []:
+            session.add(OutboxMessage(shop_domain=shop_domain, kind=kind, payload=payload, status='pending',
+                                      attempts=0, max_attempts=max_attempts, next_attempt_at=datetime.utcnow()))
+
+    def _outbox_to_dict(self, message):
+        return {
+            'id': message.id,
+            'shop_domain': message.shop_domain,
+            'kind': message.kind,
+            'payload': message.payload or {},
+            'attempts': message.attempts,
+            'max_attempts': message.max_attempts,
+            'created_at': message.created_at.isoformat() if message.created_at else None
+        }
+
+    def enqueue_outbox(self, shop_domain, kind, payload):
+        """Record one outbox message on its own, for calls not tied to a local write"""
+        session = self._get_session()
+        try:
+            self._add_outbox(session, shop_domain, [(kind, payload)])
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error queueing {kind} outbox message for {shop_domain}: {str(e)}")
+            return False
+        finally:
+            session.close()
+
+    def _try_claim_lock(self, session, lock_id, shop_domain):
+        """Take the transaction-scoped advisory lock for claiming a shop's rows, or return False if
+        another claimer holds it. Statements run after it see every earlier claim of the shop committed."""
+        return bool(session.execute(sa_select(func.pg_try_advisory_xact_lock(lock_id, func.hashtext(shop_domain or '')))).scalar())
+
+    def claim_outbox_messages(self, limit=100, stale_after=300):
+        """Move up to `limit` due outbox messages to 'sending' and return them oldest first.
+        Messages stuck in 'sending' for stale_after seconds (a dead dispatcher) are claimed again.
+        A message is held back while an older one of its shop is being sent or waiting for a retry,
+        so each shop's calls reach AeroChat in order. Claims of a shop are serialized with an advisory
+        lock, so a concurrent dispatcher cannot miss an older message that is being claimed."""
+        session = self._get_session()
+        try:
+            now = datetime.utcnow()
+            stale = now - timedelta(seconds=stale_after)
+            older = aliased(OutboxMessage)
+            blocked = session.query(older.id).filter(
+                older.shop_domain == OutboxMessage.shop_domain,
+                older.id < OutboxMessage.id,
+                or_(
+                    (older.status == 'sending') & (older.claimed_at >= stale),
+                    (older.status == 'pending') & (older.next_attempt_at > now)
+                )
+            ).exists()
+            due = or_(
+                (OutboxMessage.status == 'pending') & (OutboxMessage.next_attempt_at <= now),
+                (OutboxMessage.status == 'sending') & (OutboxMessage.claimed_at < stale)
+            )
+            shops = (session.query(OutboxMessage.shop_domain).filter(due).group_by(OutboxMessage.shop_domain)
+                     .order_by(func.min(OutboxMessage.id)).limit(limit).all())
+            messages = []
+            for (shop_domain,) in shops:
+                if len(messages) >= limit:
+                    break
+                if not self._try_claim_lock(session, OUTBOX_CLAIM_LOCK_ID, shop_domain):
+                    continue  # another dispatcher is claiming this shop's messages
+                # A new statement, so its snapshot includes claims committed before the lock was taken
+                messages.extend(session.query(OutboxMessage).filter(OutboxMessage.shop_domain == shop_domain, due, ~blocked)
+                                .order_by(OutboxMessage.id).limit(limit - len(messages)).with_for_update(skip_locked=True).all())
+            messages.sort(key=lambda message: message.id)
+            for message in messages:
+                message.status = 'sending'
+                message.attempts = (message.attempts or 0) + 1
+                message.claimed_at = now
+            claimed = [self._outbox_to_dict(message) for message in messages]
+            session.commit()
+            return claimed
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error claiming outbox messages: {str(e)}")
+            return []
+        finally:
+            session.close()
+
+    def complete_outbox_messages(self, message_ids):
+        session = self._get_session()
+        try:
+            session.query(OutboxMessage).filter(OutboxMessage.id.in_(message_ids)).delete(synchronize_session=False)
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error completing outbox messages {message_ids}: {str(e)}")
+            return False
+        finally:
+            session.close()
+
+    def retry_outbox_messages(self, message_ids, error, retry_base=15, retry_cap=3600):
+        """Record a failed delivery. Messages with attempts left go back to 'pending' after
+        retry_base * 2^(attempts - 1) seconds (at most retry_cap); the rest are marked 'failed'."""
+        session = self._get_session()
+        try:
+            now = datetime.utcnow()
+            for message in session.query(OutboxMessage).filter(OutboxMessage.id.in_(message_ids)):
+                message.last_error = error
+                if message.attempts < message.max_attempts:
+                    message.status = 'pending'
+                    delay = min(retry_cap, retry_base * (2 ** max(message.attempts - 1, 0)))
+                    message.next_attempt_at = now + timedelta(seconds=delay)
+                else:
+                    message.status = 'failed'
+                    logger.error(f"Outbox message {message.id} ({message.kind} for {message.shop_domain}) failed permanently: {error}")
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error rescheduling outbox messages {message_ids}: {str(e)}")
+            return False
+        finally:
+            session.close()
+
     def log_database_state(self):
         """Log current database state for debugging"""
         session = self._get_session()
@@ -660,26 +1547,34 @@ class ShopifyAppDatabase:
             session.close()
 
     def get_pages_count(self, shop_domain):
-        """Get count of pages for a shop"""
+        """Get count of pages for a shop (a shop_content_stats primary-key lookup)"""
+        session = self._get_session()
         try:
-            session = self.SessionFactory()
-            count = session.query(Page).filter(Page.shop_domain == shop_domain).count()
-            session.close()
-            return count
+            stats = session.get(ShopContentStats, shop_domain)
+            if stats is not None:
+                return stats.pages_count
+            # Shop not written since shop_content_stats was added; its first save/delete creates the row
+            return session.query(func.count(Page.id)).filter(Page.shop_domain == shop_domain).scalar()
         except Exception as e:
             logger.error(f"Error getting pages count for {shop_domain}: {str(e)}")
             return 0
+        finally:
+            session.close()
 
     def get_articles_count(self, shop_domain):
-        """Get count of articles for a shop"""
+        """Get count of articles for a shop (a shop_content_stats primary-key lookup)"""
+        session = self._get_session()
         try:
-            session = self.SessionFactory()
-            count = session.query(Article).filter(Article.shop_domain == shop_domain).count()
-            session.close()
-            return count
+            stats = session.get(ShopContentStats, shop_domain)
+            if stats is not None:
+                return stats.articles_count
+            # Shop not written since shop_content_stats was added; its first save/delete creates the row
+            return session.query(func.count(Article.id)).filter(Article.shop_domain == shop_domain).scalar()
         except Exception as e:
             logger.error(f"Error getting articles count for {shop_domain}: {str(e)}")
             return 0
+        finally:
+            session.close()
 
     def get_products_count(self, shop_domain):
         """Get static count of products for a shop (managed separately)"""
@@ -701,6 +1596,161 @@ class ShopifyAppDatabase:
             logger.error(f"Error getting collections count for {shop_domain}: {str(e)}")
             return 0
 
+    def _job_to_dict(self, job):
+        return {
+            'id': job.id,
+            'shop_domain': job.shop_domain,
+            'job_type': job.job_type,
+            'status': job.status,
+            'attempts': job.attempts,
+            'max_attempts': job.max_attempts,
+            'progress': job.progress or {},
+            'result': job.result,
+            'error': job.error,
+            'created_at': job.created_at.isoformat() if job.created_at else None,
+            'started_at': job.started_at.isoformat() if job.started_at else None,
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None
+        }
+
+    def enqueue_job(self, shop_domain, job_type, max_attempts=3):
+        """Queue a background job for the shop. If the same job is already queued or running it is returned instead."""
+        with self.shop_locks.hold(shop_domain):
+            session = self._get_session()
+            try:
+                job = session.query(SyncJob).filter(
+                    SyncJob.shop_domain == shop_domain,
+                    SyncJob.job_type == job_type,
+                    SyncJob.status.in_(('queued', 'running'))
+                ).first()
+                if not job:
+                    job = SyncJob(shop_domain=shop_domain, job_type=job_type, max_attempts=max_attempts,
+                                  progress={}, run_after=datetime.utcnow(), created_at=datetime.utcnow())
+                    session.add(job)
+                    session.commit()
+                    logger.info(f"Queued {job_type} job {job.id} for {shop_domain}")
+                return self._job_to_dict(job)
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Error queueing {job_type} job for {shop_domain}: {str(e)}")
+                return None
+            finally:
+                session.close()
+
+    def claim_next_job(self, stale_after=300, max_shops=20):
+        """Atomically move the oldest due job to 'running' and return it, or None.
+        Running jobs whose heartbeat is older than stale_after seconds (a dead worker) are claimed again.
+        A shop runs one job at a time: its jobs wait while another of them is running, and claims of
+        a shop are serialized with an advisory lock, as in claim_outbox_messages."""
+        session = self._get_session()
+        try:
+            now = datetime.utcnow()
+            stale = now - timedelta(seconds=stale_after)
+            other = aliased(SyncJob)
+            busy = session.query(other.id).filter(
+                other.shop_domain == SyncJob.shop_domain,
+                other.id != SyncJob.id,
+                other.status == 'running',
+                other.heartbeat_at >= stale
+            ).exists()
+            due = or_(
+                (SyncJob.status == 'queued') & (SyncJob.run_after <= now),
+                (SyncJob.status == 'running') & (SyncJob.heartbeat_at < stale)
+            )
+            shops = (session.query(SyncJob.shop_domain).filter(due, ~busy).group_by(SyncJob.shop_domain)
+                     .order_by(func.min(SyncJob.run_after)).limit(max_shops).all())
+            job = None
+            for (shop_domain,) in shops:
+                if not self._try_claim_lock(session, JOB_CLAIM_LOCK_ID, shop_domain):
+                    continue  # another worker is claiming a job of this shop
+                # A new statement, so its snapshot includes claims committed before the lock was taken
+                job = (session.query(SyncJob).filter(SyncJob.shop_domain == shop_domain, due, ~busy)
+                       .order_by(SyncJob.run_after).with_for_update(skip_locked=True).first())
+                if job:
+                    break
+            if not job:
+                session.rollback()
+                return None
+            job.status = 'running'
+            job.attempts = (job.attempts or 0) + 1
+            job.started_at = now
+            job.heartbeat_at = now
+            job.error = None
+            session.commit()
+            return self._job_to_dict(job)
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error claiming sync job: {str(e)}")
+            return None
+        finally:
+            session.close()
+
+    def update_job_progress(self, job_id, progress):
+        session = self._get_session()
+        try:
+            session.query(SyncJob).filter(SyncJob.id == job_id).update(
+                {SyncJob.progress: progress, SyncJob.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error updating progress for job {job_id}: {str(e)}")
+            return False
+        finally:
+            session.close()
+
+    def complete_job(self, job_id, result, progress=None):
+        session = self._get_session()
+        try:
+            values = {SyncJob.status: 'succeeded', SyncJob.result: result, SyncJob.finished_at: datetime.utcnow()}
+            if progress is not None:
+                values[SyncJob.progress] = progress
+            session.query(SyncJob).filter(SyncJob.id == job_id).update(values, synchronize_session=False)
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error completing job {job_id}: {str(e)}")
+            return False
+        finally:
+            session.close()
+
+    def fail_job(self, job_id, error, retry_delay=None, result=None, progress=None):
+        """Record a failed attempt. With retry_delay (seconds) the job is re-queued if attempts remain, otherwise it is marked failed."""
+        session = self._get_session()
+        try:
+            job = session.query(SyncJob).filter(SyncJob.id == job_id).first()
+            if not job:
+                return False
+            job.error = error
+            job.result = result
+            if progress is not None:
+                job.progress = progress
+            if retry_delay is not None and job.attempts < job.max_attempts:
+                job.status = 'queued'
+                job.run_after = datetime.utcnow() + timedelta(seconds=retry_delay)
+            else:
+                job.status = 'failed'
+                job.finished_at = datetime.utcnow()
+            session.commit()
+            return job.status
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error failing job {job_id}: {str(e)}")
+            return False
+        finally:
+            session.close()
+
+    def get_job(self, job_id):
+        session = self._get_session()
+        try:
+            job = session.query(SyncJob).filter(SyncJob.id == job_id).first()
+            return self._job_to_dict(job) if job else None
+        except Exception as e:
+            logger.error(f"Error getting job {job_id}: {str(e)}")
+            return None
+        finally:
+            session.close()
+
     def __del__(self):
         """Cleanup database connections"""
         try:
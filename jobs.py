@@ -0,0 +1,147 @@
+# jobs.py
+import time
+import threading
+from config import logger, SYNC_WORKERS, SYNC_JOB_MAX_ATTEMPTS
+from database import db
+from content_sync import sync_content, sync_all_content, initial_sync_pages_and_articles
+
+class JobFailed(Exception):
+    """Raised by a job handler when the attempt should be retried. result is kept on the job row."""
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+class JobProgress:
+    """Thread-safe fetched/saved/queued/deleted counters, written to the job row at most every `interval` seconds.
+    While started it also flushes every `heartbeat` seconds so a long quiet step is not mistaken for a dead worker."""
+    def __init__(self, job_id, interval=2.0, heartbeat=60.0):
+        self.job_id = job_id
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.counts = {'fetched': 0, 'saved': 0, 'queued': 0, 'deleted': 0}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self._done = threading.Event()
+
+    def _beat(self):
+        while not self._done.wait(self.heartbeat):
+            self.flush()
+
+    def start(self):
+        threading.Thread(target=self._beat, name=f'job-heartbeat-{self.job_id}', daemon=True).start()
+
+    def stop(self):
+        self._done.set()
+
+    def __call__(self, **counts):
+        with self._lock:
+            for key, value in counts.items():
+                self.counts[key] = self.counts.get(key, 0) + (value or 0)
+            due = time.monotonic() - self._last_flush >= self.interval
+        if due:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        db.update_job_progress(self.job_id, self.snapshot())
+
+def _load_shop(shop):
+    shop_data = db.get_shop(shop)
+    if not shop_data or not shop_data.get('access_token'):
+        raise JobFailed(f"Shop {shop} not found or not authenticated")
+    return shop_data
+
+def _run_content_sync(resource):
+    def handler(shop, progress):
+        shop_data = _load_shop(shop)
+        result = sync_content(shop, shop_data['access_token'], shop_data.get('company_id'), resource, progress=progress)
+        if result.get('status') != 'success':
+            raise JobFailed(result.get('error') or f"{resource} sync incomplete", result=result)
+        return result
+    return handler
+
+def _run_sync_all(mode):
+    def handler(shop, progress):
+        shop_data = _load_shop(shop)
+        result = sync_all_content(shop, shop_data['access_token'], shop_data.get('company_id'), progress=progress, mode=mode)
+        if result.get('status') != 'success':
+            raise JobFailed('; '.join(result.get('errors') or ['Sync incomplete']), result=result)
+        return result
+    return handler
+
+def _run_initial_sync(shop, progress):
+    shop_data = _load_shop(shop)
+    result = initial_sync_pages_and_articles(shop, shop_data['access_token'], shop_data.get('company_id'))
+    progress(saved=result.get('pages_saved', 0) + result.get('articles_saved', 0))
+    if not result.get('success'):
+        raise JobFailed(result.get('error') or 'Initial sync failed', result=result)
+    return result
+
+JOB_HANDLERS = {
+    'sync_pages': _run_content_sync('pages'),
+    'sync_articles': _run_content_sync('articles'),
+    'sync_all': _run_sync_all('auto'),
+    'full_sync': _run_sync_all('full'),
+    'initial_sync': _run_initial_sync,
+}
+
+def enqueue_job(shop, job_type):
+    """Queue job_type for the shop (or return the one already queued/running). Returns the job dict or None."""
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job type: {job_type}")
+    return db.enqueue_job(shop, job_type, max_attempts=SYNC_JOB_MAX_ATTEMPTS)
+
+def run_job(job, retry_base=30):
+    """Run one claimed job and record the outcome; failed attempts are retried with exponential backoff"""
+    progress = JobProgress(job['id'])
+    progress.start()
+    try:
+        logger.info(f"Running {job['job_type']} job {job['id']} for {job['shop_domain']} (attempt {job['attempts']})")
+        result = JOB_HANDLERS[job['job_type']](job['shop_domain'], progress)
+        db.complete_job(job['id'], result, progress=progress.snapshot())
+        logger.info(f"Job {job['id']} succeeded")
+    except Exception as e:
+        retry_delay = retry_base * (2 ** (job['attempts'] - 1))
+        status = db.fail_job(job['id'], str(e), retry_delay=retry_delay,
+                             result=getattr(e, 'result', None), progress=progress.snapshot())
+        logger.error(f"Job {job['id']} ({job['job_type']} for {job['shop_domain']}) failed: {str(e)}; now {status}")
+    finally:
+        progress.stop()
+
+class JobWorkerPool:
+    """Daemon threads that claim jobs from the sync_jobs table. Claims use SKIP LOCKED, so any
+    number of processes can run a pool against the same database."""
+    def __init__(self, size=SYNC_WORKERS, poll_interval=2.0):
+        self.size = size
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _loop(self):
+        while not self._stop.is_set():
+            job = db.claim_next_job()
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            run_job(job)
+
+    def start(self):
+        if self._threads or self.size <= 0:
+            return
+        for i in range(self.size):
+            thread = threading.Thread(target=self._loop, name=f'sync-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.size} sync job workers")
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+worker_pool = JobWorkerPool()
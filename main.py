@@ -2,8 +2,11 @@
 from flask import Flask
 import os
 from config import logger, SECRET_KEY
-from routes import install, callback, check_subscription, home, debug_shop, fetch_pages, sync_pages, sync_articles, public_dashboard, get_store_info, get_app_embed_url, api_initial_sync,connect
-from webhook_routes import uninstall_webhook, subscription_webhook, customers_data_request_webhook, customers_redact_webhook, shop_redact_webhook
+from routes import install, callback, check_subscription, home, debug_shop, fetch_pages, sync_pages, sync_articles, public_dashboard, get_store_info, get_app_embed_url, api_initial_sync,connect, sync_all, sync_full, sync_job_status, company_status, cache_metrics
+from webhook_routes import uninstall_webhook, subscription_webhook, content_webhook, customers_data_request_webhook, customers_redact_webhook, shop_redact_webhook
+from jobs import worker_pool
+from outbox import outbox_dispatcher
+from webhook_queue import webhook_workers
 from flask_cors import CORS  # <-- add this
 app = Flask(__name__)
 app.config['SESSION_COOKIE_SECURE'] = True
@@ -20,18 +23,31 @@ app.route('/debug/shop/<shop_domain>')(debug_shop)
 app.route('/fetch_pages')(fetch_pages)
 app.route('/sync_pages')(sync_pages)
 app.route('/sync_articles')(sync_articles)
+app.route('/sync_all')(sync_all)
+app.route('/sync_full')(sync_full)
 app.route('/public_dashboard')(public_dashboard)
 app.route('/api/store_info')(get_store_info)
 app.route('/api/app_embed_url')(get_app_embed_url)
+app.route('/api/company_status')(company_status)
+app.route('/api/cache_metrics')(cache_metrics)
 app.route('/api/initial_sync')(api_initial_sync)
+app.route('/api/sync_status/<job_id>')(sync_job_status)
 app.route('/connect')(connect)
 # Register webhook routes
 app.route('/webhooks/uninstall', methods=['POST'])(uninstall_webhook)
 app.route('/webhooks/subscription', methods=['POST'])(subscription_webhook)
+app.route('/webhooks/content', methods=['POST'])(content_webhook)
 app.route('/webhooks/customers/data_request', methods=['POST'])(customers_data_request_webhook)
 app.route('/webhooks/customers/redact', methods=['POST'])(customers_redact_webhook)
 app.route('/webhooks/shop/redact', methods=['POST'])(shop_redact_webhook)
 
+# Background workers for sync jobs queued by /sync_pages, /sync_articles, /sync_all, /sync_full and /api/initial_sync
+worker_pool.start()
+# Delivers AeroChat calls recorded in the outbox table by webhooks and syncs
+outbox_dispatcher.start()
+# Process webhooks queued by the /webhooks/* routes
+webhook_workers.start()
+
 if __name__ == '__main__':
     logger.info("Starting Shopify App...")
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,124 @@
+# outbox.py
+import threading
+from config import logger, OUTBOX_BATCH_SIZE, OUTBOX_RETRY_BASE, OUTBOX_POLL_INTERVAL, THIRD_PARTY_PUSH_BATCH_SIZE
+from database import db
+from content_sync import (_call_third_party_pages_bulk, _call_third_party_articles_bulk,
+                          _call_third_party_pages_delete, _call_third_party_articles_delete)
+from webhook_routes import notify_third_party_unsubscribe, notify_third_party_subscription
+
+def _deliver_subscription(shop_domain, payloads):
+    # Each payload sets the shop's current plan, so only the latest one matters
+    return notify_third_party_subscription(payloads[-1])
+
+def _deliver_unsubscribe(shop_domain, payloads):
+    return notify_third_party_unsubscribe(shop_domain)
+
+def _content_pusher(get_stored, push, slice_size=THIRD_PARTY_PUSH_BATCH_SIZE):
+    def deliver(shop_domain, payloads):
+        """Push the stored rows of every id in the batch; ids deleted since are simply gone. Rows are
+        loaded and pushed slice_size ids at a time, so only one slice of bodies is in memory, and
+        delivery stops at the first slice that could not be loaded or AeroChat did not fully accept."""
+        groups = {}
+        for payload in payloads:
+            group = groups.setdefault(payload.get('company_id'), {'ids': set(), 'previous_sync_time': payload.get('previous_sync_time')})
+            group['ids'].update(payload.get('ids') or [])
+        for company_id, group in groups.items():
+            ids = sorted(group['ids'])
+            for start in range(0, len(ids), slice_size):
+                items = get_stored(shop_domain, ids=ids[start:start + slice_size], with_body=True)
+                if items is None:
+                    return False
+                if items and push(company_id, items, prev_sync_time=group['previous_sync_time']) < len(items):
+                    return False
+        return True
+    return deliver
+
+def _content_deleter(delete):
+    def deliver(shop_domain, payloads):
+        """Bulk delete every id in the batch; succeeds once AeroChat confirmed all of them"""
+        groups = {}
+        for payload in payloads:
+            groups.setdefault(payload.get('company_id'), set()).update(payload.get('ids') or [])
+        return all(len(delete(company_id, sorted(ids))) == len(ids) for company_id, ids in groups.items())
+    return deliver
+
+# kind -> deliver(shop_domain, payloads) returning True once AeroChat accepted every payload
+HANDLERS = {
+    'subscription': _deliver_subscription,
+    'unsubscribe': _deliver_unsubscribe,
+    'push_pages': _content_pusher(db.get_stored_pages, _call_third_party_pages_bulk),
+    'push_articles': _content_pusher(db.get_stored_articles, _call_third_party_articles_bulk),
+    'delete_pages': _content_deleter(_call_third_party_pages_delete),
+    'delete_articles': _content_deleter(_call_third_party_articles_delete),
+}
+
+def _coalesce(messages):
+    """Group claimed messages (oldest first) into runs of consecutive messages of one kind per shop,
+    so a shop's calls are still made in the order they were recorded"""
+    runs = []
+    last_run = {}
+    for message in messages:
+        run = last_run.get(message['shop_domain'])
+        if run is None or run[0]['kind'] != message['kind']:
+            run = []
+            runs.append(run)
+            last_run[message['shop_domain']] = run
+        run.append(message)
+    return runs
+
+def dispatch(messages, retry_base=OUTBOX_RETRY_BASE):
+    """Deliver claimed outbox messages, one call per run of same-kind messages of a shop, then
+    delete or reschedule them. Once a shop's run fails its later runs wait for the retry too."""
+    failed_shops = set()
+    for run in _coalesce(messages):
+        shop_domain, kind = run[0]['shop_domain'], run[0]['kind']
+        message_ids = [message['id'] for message in run]
+        if shop_domain in failed_shops:
+            db.retry_outbox_messages(message_ids, "Waiting for an earlier message of this shop", retry_base=retry_base)
+            continue
+        handler = HANDLERS.get(kind)
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown outbox message kind: {kind}")
+            delivered = handler(shop_domain, [message['payload'] for message in run])
+            error = None if delivered else f"{kind} delivery was not accepted"
+        except Exception as e:
+            error = str(e)
+        if error:
+            logger.warning(f"Outbox {kind} for {shop_domain} failed ({len(run)} messages): {error}")
+            failed_shops.add(shop_domain)
+            db.retry_outbox_messages(message_ids, error, retry_base=retry_base)
+        else:
+            db.complete_outbox_messages(message_ids)
+
+class OutboxDispatcher:
+    """Daemon thread delivering outbox messages to AeroChat. Claims use SKIP LOCKED, so every
+    process can run a dispatcher against the same table."""
+    def __init__(self, batch_size=OUTBOX_BATCH_SIZE, poll_interval=OUTBOX_POLL_INTERVAL):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            messages = db.claim_outbox_messages(limit=self.batch_size)
+            if not messages:
+                self._stop.wait(self.poll_interval)
+                continue
+            dispatch(messages)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name='outbox-dispatcher', daemon=True)
+        self._thread.start()
+        logger.info("Started outbox dispatcher")
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+outbox_dispatcher = OutboxDispatcher()
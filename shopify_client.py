@@ -0,0 +1,160 @@
+# shopify_client.py
+import time
+from threading import Lock
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from config import logger, SHOPIFY_API_VERSION, SHOPIFY_CONNECT_TIMEOUT, SHOPIFY_READ_TIMEOUT
+
+class ShopifyAPIError(Exception):
+    """Raised when the Shopify Admin API answers with an unexpected HTTP status"""
+    def __init__(self, status_code, text):
+        super().__init__(f"HTTP {status_code}: {text}")
+        self.status_code = status_code
+        self.text = text
+
+class ShopifyThrottledError(Exception):
+    """Raised when a GraphQL query is still THROTTLED after the retry budget is used up"""
+
+def _is_throttled(result):
+    return any(
+        (error.get('extensions') or {}).get('code') == 'THROTTLED'
+        for error in (result.get('errors') or [])
+        if isinstance(error, dict)
+    )
+
+class ShopifyRateLimiter:
+    """Per-shop leaky bucket mirroring Shopify's GraphQL cost throttle.
+
+    Every response's extensions.cost.throttleStatus (currentlyAvailable, maximumAvailable,
+    restoreRate) resets our view of the shop's bucket; in between it refills at restoreRate
+    points per second. acquire() reserves the expected query cost and sleeps exactly as long
+    as the bucket needs to refill to cover it, so concurrent callers for one shop share the
+    same budget. Shops we have not heard from yet are not paced.
+    """
+    def __init__(self):
+        self._buckets = {}  # shop -> {'available', 'maximum', 'restore_rate', 'updated'}
+        self._lock = Lock()
+
+    def _refill(self, bucket, now):
+        elapsed = now - bucket['updated']
+        bucket['available'] = min(bucket['maximum'], bucket['available'] + elapsed * bucket['restore_rate'])
+        bucket['updated'] = now
+
+    def acquire(self, shop, cost):
+        """Block until `cost` points are available for the shop, then reserve them"""
+        while True:
+            with self._lock:
+                bucket = self._buckets.get(shop)
+                if bucket is None:
+                    return
+                self._refill(bucket, time.monotonic())
+                # A query can never cost more than the whole bucket
+                cost = min(cost, bucket['maximum'])
+                if bucket['available'] >= cost:
+                    bucket['available'] -= cost
+                    return
+                wait = (cost - bucket['available']) / bucket['restore_rate']
+            logger.info(f"Rate limiting {shop}: waiting {wait:.2f}s for {cost} query cost points")
+            time.sleep(wait)
+
+    def update(self, shop, throttle_status):
+        """Record the authoritative bucket state from a response's throttleStatus"""
+        if not throttle_status or not throttle_status.get('restoreRate'):
+            return
+        with self._lock:
+            self._buckets[shop] = {
+                'available': float(throttle_status.get('currentlyAvailable', 0)),
+                'maximum': float(throttle_status.get('maximumAvailable', 0)),
+                'restore_rate': float(throttle_status['restoreRate']),
+                'updated': time.monotonic()
+            }
+
+class ShopifyClient:
+    """Shared Shopify Admin API client.
+
+    Keeps one keep-alive requests.Session (with its own connection pool) per shop so paginated
+    syncs and dashboard loads reuse warm TCP+TLS connections. The least recently used shop
+    sessions are closed once more than max_shops are open.
+    """
+    def __init__(self, api_version=SHOPIFY_API_VERSION, connect_timeout=SHOPIFY_CONNECT_TIMEOUT,
+                 read_timeout=SHOPIFY_READ_TIMEOUT, max_shops=256, pool_maxsize=10, max_throttle_retries=5):
+        self.api_version = api_version
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_shops = max_shops
+        self.pool_maxsize = pool_maxsize
+        self.max_throttle_retries = max_throttle_retries
+        self.rate_limiter = ShopifyRateLimiter()
+        self._query_costs = {}  # query text -> last requestedQueryCost, used to pace the next call
+        self._sessions = OrderedDict()  # shop -> requests.Session, most recently used last
+        self._lock = Lock()
+
+    def _session(self, shop):
+        with self._lock:
+            http = self._sessions.get(shop)
+            if http is not None:
+                self._sessions.move_to_end(shop)
+                return http
+
+            http = requests.Session()
+            http.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize))
+            http.headers.update({
+                'Content-Type': 'application/json',
+                'Accept-Encoding': 'gzip, deflate'
+            })
+            self._sessions[shop] = http
+
+            while len(self._sessions) > self.max_shops:
+                _, evicted = self._sessions.popitem(last=False)
+                evicted.close()
+            return http
+
+    def admin_url(self, shop, path):
+        return f'https://{shop}/admin/api/{self.api_version}/{path}'
+
+    def request(self, method, shop, access_token, path, **kwargs):
+        """Send a request to the shop's Admin API and return the requests.Response"""
+        kwargs.setdefault('timeout', self.timeout)
+        headers = kwargs.pop('headers', {})
+        headers['X-Shopify-Access-Token'] = access_token
+        return self._session(shop).request(method, self.admin_url(shop, path), headers=headers, **kwargs)
+
+    def rest_post(self, shop, access_token, path, payload):
+        return self.request('POST', shop, access_token, path, json=payload)
+
+    def graphql(self, shop, access_token, query, variables=None):
+        """Run a GraphQL Admin API query and return the decoded JSON body (data/errors/extensions).
+
+        Requests are paced by the shop's cost budget, and THROTTLED responses are retried after
+        waiting for the bucket to refill. Raises ShopifyAPIError on a non-200 response and
+        ShopifyThrottledError if the query is still throttled after max_throttle_retries.
+        """
+        body = {'query': query}
+        if variables:
+            body['variables'] = variables
+
+        for attempt in range(self.max_throttle_retries + 1):
+            self.rate_limiter.acquire(shop, self._query_costs.get(query, 1))
+            response = self.request('POST', shop, access_token, 'graphql.json', json=body)
+            if response.status_code != 200:
+                raise ShopifyAPIError(response.status_code, response.text)
+            result = response.json()
+
+            cost = (result.get('extensions') or {}).get('cost') or {}
+            self.rate_limiter.update(shop, cost.get('throttleStatus'))
+            if cost.get('requestedQueryCost'):
+                self._query_costs[query] = cost['requestedQueryCost']
+
+            if not _is_throttled(result):
+                return result
+            logger.warning(f"GraphQL query throttled for {shop} (attempt {attempt + 1}/{self.max_throttle_retries + 1}), throttleStatus: {cost.get('throttleStatus')}")
+
+        raise ShopifyThrottledError(f"Query still throttled for {shop} after {self.max_throttle_retries + 1} attempts")
+
+    def close(self):
+        with self._lock:
+            for http in self._sessions.values():
+                http.close()
+            self._sessions.clear()
+
+shopify_client = ShopifyClient()
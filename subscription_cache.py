@@ -0,0 +1,77 @@
+# subscription_cache.py
+import time
+import threading
+from datetime import datetime, timedelta
+from config import SUBSCRIPTION_CACHE_TTL, SUBSCRIPTION_TABLE_TTL
+from database import db
+from utils import get_active_subscriptions
+
+class SubscriptionStatusCache:
+    """Answers "does this shop have an active subscription?" for home() without a Shopify call per load.
+
+    Lookups go through three tiers: an in-process entry younger than ttl seconds, then an ACTIVE
+    row in subscriptions1 written within table_ttl seconds (by /webhooks/subscription or an earlier
+    live check, so it is shared by all processes), and only then Shopify's activeSubscriptions,
+    whose answer is written back to the table. Subscription writes NOTIFY through the shop cache
+    channel, so every process drops its entry for that shop. A failed Shopify call is never cached;
+    the stored row answers until Shopify can be asked again.
+    """
+    def __init__(self, ttl=SUBSCRIPTION_CACHE_TTL, table_ttl=SUBSCRIPTION_TABLE_TTL):
+        self.ttl = ttl
+        self.table_ttl = table_ttl
+        self._entries = {}  # shop -> (active, checked_at)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'table_hits': 0, 'misses': 0}
+
+    def is_active(self, shop, access_token):
+        db.listen_for_shop_changes(self.invalidate)
+        with self._lock:
+            entry = self._entries.get(shop)
+            if entry and time.monotonic() - entry[1] < self.ttl:
+                self._stats['hits'] += 1
+                return entry[0]
+
+        subscription = db.get_active_subscription(shop)
+        if subscription and subscription.get('updated_at'):
+            updated_at = datetime.fromisoformat(subscription['updated_at'])
+            if datetime.now() - updated_at < timedelta(seconds=self.table_ttl):
+                self._count('table_hits')
+                self.set(shop, True)
+                return True
+
+        self._count('misses')
+        active_subscriptions = get_active_subscriptions(shop, access_token)
+        if active_subscriptions is None:
+            # Shopify could not be asked; go by the stored row, however old, and check again next time
+            return subscription is not None
+        for active_subscription in active_subscriptions:
+            db.create_or_update_subscription(shop, active_subscription)
+        self.set(shop, bool(active_subscriptions))
+        return bool(active_subscriptions)
+
+    def set(self, shop, active):
+        with self._lock:
+            self._entries[shop] = (active, time.monotonic())
+
+    def invalidate(self, shop=None):
+        """Drop shop's entry, or every entry when shop is None"""
+        with self._lock:
+            if shop is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(shop, None)
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self):
+        """Lookup counters and hit rate (memory and table hits over all lookups)"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['table_hits'] + stats['misses']
+        stats['lookups'] = lookups
+        stats['hit_rate'] = round((stats['hits'] + stats['table_hits']) / lookups, 4) if lookups else None
+        return stats
+
+subscription_cache = SubscriptionStatusCache()
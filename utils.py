@@ -4,19 +4,15 @@ import hmac
 import hashlib
 import base64
 import json
-from config import logger, API_SECRET
+import time
+from config import logger, API_SECRET, BULK_SYNC_THRESHOLD, BULK_OPERATION_TIMEOUT
+from shopify_client import shopify_client
 
 def get_shop_details(shop, access_token):
     """Get comprehensive shop details including email, ID, and name"""
     logger.info(f"Fetching shop details for: {shop}")
     
     try:
-        graphql_url = f'https://{shop}/admin/api/2025-01/graphql.json'
-        headers = {
-            'Content-Type': 'application/json', 
-            'X-Shopify-Access-Token': access_token
-        }
-        
         query = '''
         query {
             shop {
@@ -29,14 +25,7 @@ def get_shop_details(shop, access_token):
         }
         '''
         
-        response = requests.post(graphql_url, json={'query': query}, headers=headers)
-        logger.info(f"Shop details API response status: {response.status_code}")
-        
-        if response.status_code != 200:
-            logger.error(f"Failed to get shop details: {response.text}")
-            return {}
-            
-        result = response.json()
+        result = shopify_client.graphql(shop, access_token, query)
         
         if 'errors' in result:
             logger.error(f"GraphQL errors in shop details: {result['errors']}")
@@ -52,16 +41,11 @@ def get_shop_details(shop, access_token):
         return {}
 
 def get_active_subscriptions(shop, access_token):
-    """Get active subscriptions for a shop"""
+    """Get active subscriptions for a shop. Returns None if Shopify could not be asked, so callers
+    can tell a failed check from a shop without subscriptions."""
     logger.info(f"Fetching active subscriptions for: {shop}")
     
     try:
-        graphql_url = f'https://{shop}/admin/api/2025-01/graphql.json'
-        headers = {
-            'Content-Type': 'application/json',
-            'X-Shopify-Access-Token': access_token
-        }
-
         query = '''
         query {
   currentAppInstallation {
@@ -91,18 +75,11 @@ def get_active_subscriptions(shop, access_token):
 
 '''
 
-        response = requests.post(graphql_url, json={'query': query}, headers=headers)
-        logger.info(f"Subscriptions API response status: {response.status_code}")
-        
-        if response.status_code != 200:
-            logger.error(f"Failed to get subscriptions: {response.text}")
-            return []
-            
-        result = response.json()
+        result = shopify_client.graphql(shop, access_token, query)
 
         if 'errors' in result:
             logger.error(f"GraphQL errors in subscriptions: {result['errors']}")
-            return []
+            return None
 
         subscriptions = result.get('data', {}).get('currentAppInstallation', {}).get('activeSubscriptions', [])
         logger.info(f"Active subscriptions found: {len(subscriptions)}")
@@ -114,21 +91,30 @@ def get_active_subscriptions(shop, access_token):
         
     except Exception as e:
         logger.error(f"Exception getting subscriptions for {shop}: {str(e)}")
-        return []
+        return None
+
+def _normalize_content_node(node, shop_id):
+    """Map a GraphQL Page/Article node onto the dict shape used by the DB and AeroChat pushes"""
+    return {
+        'id': node.get('id'),
+        'title': node.get('title'),
+        'handle': node.get('handle'),
+        'body': node.get('body'),
+        'created_at': node.get('createdAt'),
+        'updated_at': node.get('updatedAt'),
+        'published_at': node.get('publishedAt'),
+        'published': bool(node.get('publishedAt')),
+        'store_id': shop_id,
+    }
 
-def get_pages(shop, access_token, cursor=None, limit=100):
-    """Fetch pages from Shopify via GraphQL with optional pagination cursor."""
+def get_pages(shop, access_token, cursor=None, limit=100, search_query=None):
+    """Fetch pages from Shopify via GraphQL with optional pagination cursor and search_query (e.g. updated_at:>'...').
+    On failure the result carries an 'error' key; callers must not treat it as the end of the data."""
     logger.info(f"Fetching pages for: {shop}, after: {cursor}")
     try:
-        graphql_url = f'https://{shop}/admin/api/2025-01/graphql.json'
-        headers = {
-            'Content-Type': 'application/json',
-            'X-Shopify-Access-Token': access_token
-        }
-
         query = '''
-        query getPages($first: Int!, $after: String) {
-          pages(first: $first, after: $after) {
+        query getPages($first: Int!, $after: String, $query: String) {
+          pages(first: $first, after: $after, query: $query) {
             edges {
               cursor
               node {
@@ -153,38 +139,20 @@ def get_pages(shop, access_token, cursor=None, limit=100):
         variables = { 'first': limit }
         if cursor:
             variables['after'] = cursor
+        if search_query:
+            variables['query'] = search_query
 
-        response = requests.post(graphql_url, json={'query': query, 'variables': variables}, headers=headers)
-        logger.info(f"Pages API response status: {response.status_code}")
-
-        if response.status_code != 200:
-            logger.error(f"Failed to get pages: {response.text}")
-            return {'pages': [], 'has_next': False, 'end_cursor': None, 'store_id': None}
-
-        result = response.json()
+        result = shopify_client.graphql(shop, access_token, query, variables)
         if 'errors' in result:
             logger.error(f"GraphQL errors in pages: {result['errors']}")
-            return {'pages': [], 'has_next': False, 'end_cursor': None, 'store_id': None}
+            return {'pages': [], 'has_next': False, 'end_cursor': None, 'store_id': None, 'error': str(result['errors'])}
 
         data = result.get('data', {})
         edges = data.get('pages', {}).get('edges', [])
         page_info = data.get('pages', {}).get('pageInfo', {})
         shop_id = data.get('shop', {}).get('id')
 
-        pages = []
-        for edge in edges:
-            node = edge.get('node', {})
-            pages.append({
-                'id': node.get('id'),
-                'title': node.get('title'),
-                'handle': node.get('handle'),
-                'body': node.get('body'),
-                'created_at': node.get('createdAt'),
-                'updated_at': node.get('updatedAt'),
-                'published_at': node.get('publishedAt'),
-                'published': bool(node.get('publishedAt')),
-                'store_id': shop_id,
-            })
+        pages = [_normalize_content_node(edge.get('node', {}), shop_id) for edge in edges]
 
         has_next = page_info.get('hasNextPage', False)
         end_cursor = page_info.get('endCursor')
@@ -192,21 +160,16 @@ def get_pages(shop, access_token, cursor=None, limit=100):
         return {'pages': pages, 'has_next': has_next, 'end_cursor': end_cursor, 'store_id': shop_id}
     except Exception as e:
         logger.error(f"Exception getting pages for {shop}: {str(e)}")
-        return {'pages': [], 'has_next': False, 'end_cursor': None, 'store_id': None}
+        return {'pages': [], 'has_next': False, 'end_cursor': None, 'store_id': None, 'error': str(e)}
 
-def get_articles(shop, access_token, cursor=None, limit=100):
-    """Fetch articles from Shopify via GraphQL with optional pagination cursor."""
+def get_articles(shop, access_token, cursor=None, limit=100, search_query=None):
+    """Fetch articles from Shopify via GraphQL with optional pagination cursor and search_query (e.g. updated_at:>'...').
+    On failure the result carries an 'error' key; callers must not treat it as the end of the data."""
     logger.info(f"Fetching articles for: {shop}, after: {cursor}")
     try:
-        graphql_url = f'https://{shop}/admin/api/2025-01/graphql.json'
-        headers = {
-            'Content-Type': 'application/json',
-            'X-Shopify-Access-Token': access_token
-        }
-
         query = '''
-        query getArticles($first: Int!, $after: String) {
-  articles(first: $first, after: $after) {
+        query getArticles($first: Int!, $after: String, $query: String) {
+  articles(first: $first, after: $after, query: $query) {
     edges {
       cursor
       node {
@@ -232,38 +195,20 @@ def get_articles(shop, access_token, cursor=None, limit=100):
         variables = { 'first': limit }
         if cursor:
             variables['after'] = cursor
+        if search_query:
+            variables['query'] = search_query
 
-        response = requests.post(graphql_url, json={'query': query, 'variables': variables}, headers=headers)
-        logger.info(f"Articles API response status: {response.status_code}")
-
-        if response.status_code != 200:
-            logger.error(f"Failed to get articles: {response.text}")
-            return {'articles': [], 'has_next': False, 'end_cursor': None, 'store_id': None}
-
-        result = response.json()
+        result = shopify_client.graphql(shop, access_token, query, variables)
         if 'errors' in result:
             logger.error(f"GraphQL errors in articles: {result['errors']}")
-            return {'articles': [], 'has_next': False, 'end_cursor': None, 'store_id': None}
+            return {'articles': [], 'has_next': False, 'end_cursor': None, 'store_id': None, 'error': str(result['errors'])}
 
         data = result.get('data', {})
         edges = data.get('articles', {}).get('edges', [])
         page_info = data.get('articles', {}).get('pageInfo', {})
         shop_id = data.get('shop', {}).get('id')
 
-        articles = []
-        for edge in edges:
-            node = edge.get('node', {})
-            articles.append({
-                'id': node.get('id'),
-                'title': node.get('title'),
-                'handle': node.get('handle'),
-                'body': node.get('body'),
-                'created_at': node.get('createdAt'),
-                'updated_at': node.get('updatedAt'),
-                'published_at': node.get('publishedAt'),
-                'published': bool(node.get('publishedAt')),
-                'store_id': shop_id,
-            })
+        articles = [_normalize_content_node(edge.get('node', {}), shop_id) for edge in edges]
 
         has_next = page_info.get('hasNextPage', False)
         end_cursor = page_info.get('endCursor')
@@ -271,156 +216,203 @@ def get_articles(shop, access_token, cursor=None, limit=100):
         return {'articles': articles, 'has_next': has_next, 'end_cursor': end_cursor, 'store_id': shop_id}
     except Exception as e:
         logger.error(f"Exception getting articles for {shop}: {str(e)}")
-        return {'articles': [], 'has_next': False, 'end_cursor': None, 'store_id': None}
-
-def get_total_pages_count(shop, access_token):
-    """Get total count of pages in Shopify store"""
-    logger.info(f"Getting total pages count for: {shop}")
-    try:
-        graphql_url = f'https://{shop}/admin/api/2025-01/graphql.json'
-        headers = {
-            'Content-Type': 'application/json',
-            'X-Shopify-Access-Token': access_token
-        }
+        return {'articles': [], 'has_next': False, 'end_cursor': None, 'store_id': None, 'error': str(e)}
 
-        query = '''
-        query {
-          pages(first: 50) {
-            edges {
-              node {
-                id
-              }
-            }
-          }
-        }
-        '''
+class ContentFetchError(Exception):
+    """Raised when pages/articles could not be listed completely; callers must skip deletions"""
 
-        response = requests.post(graphql_url, json={'query': query}, headers=headers)
-        logger.info(f"Total pages count API response status: {response.status_code}")
+BULK_CONTENT_QUERIES = {
+    'pages': '{ pages { edges { node { id title handle body createdAt updatedAt publishedAt } } } }',
+    'articles': '{ articles { edges { node { id title handle body createdAt updatedAt publishedAt } } } }',
+}
 
-        if response.status_code != 200:
-            logger.error(f"Failed to get total pages count: {response.text}")
-            return 0
+CONTENT_IDS_QUERY = '''
+query contentIds($first: Int!, $after: String) {
+  %s(first: $first, after: $after) {
+    nodes { id }
+    pageInfo { hasNextPage endCursor }
+  }
+}
+'''
 
-        result = response.json()
+def iter_content_ids(shop, access_token, resource, batch_size=250):
+    """Yield batches of the ids of every page or article of the shop. Only the id is selected, so the
+    listing costs a few KB per hundred items. Raises ContentFetchError if it could not be completed."""
+    query = CONTENT_IDS_QUERY % resource
+    cursor = None
+    while True:
+        variables = {'first': batch_size}
+        if cursor:
+            variables['after'] = cursor
+        try:
+            result = shopify_client.graphql(shop, access_token, query, variables)
+        except Exception as e:
+            raise ContentFetchError(f"Listing {resource} ids failed: {str(e)}")
         if 'errors' in result:
-            logger.error(f"GraphQL errors in total pages count: {result['errors']}")
-            return 0
-
-        edges = result.get('data', {}).get('pages', {}).get('edges', [])
-        total_count = len(edges)
-        logger.info(f"Total pages count for {shop}: {total_count}")
-        
-        return total_count
-    except Exception as e:
-        logger.error(f"Exception getting total pages count for {shop}: {str(e)}")
-        return 0
-
-def get_total_articles_count(shop, access_token):
-    """Get total count of articles in Shopify store"""
-    logger.info(f"Getting total articles count for: {shop}")
+            raise ContentFetchError(str(result['errors']))
+        connection = result.get('data', {}).get(resource) or {}
+        ids = [node.get('id') for node in connection.get('nodes', [])]
+        if ids:
+            yield ids
+        page_info = connection.get('pageInfo', {})
+        if not page_info.get('hasNextPage'):
+            break
+        cursor = page_info.get('endCursor')
+
+def get_content_count(shop, access_token, resource):
+    """Return Shopify's pagesCount/articlesCount for the store, or None if it could not be read"""
+    field = 'pagesCount' if resource == 'pages' else 'articlesCount'
     try:
-        graphql_url = f'https://{shop}/admin/api/2025-01/graphql.json'
-        headers = {
-            'Content-Type': 'application/json',
-            'X-Shopify-Access-Token': access_token
-        }
-
-        query = '''
-        query {
-          articles(first: 50) {
-            edges {
-              node {
-                id
-              }
-            }
-          }
-        }
-        '''
-
-        response = requests.post(graphql_url, json={'query': query}, headers=headers)
-        logger.info(f"Total articles count API response status: {response.status_code}")
-
-        if response.status_code != 200:
-            logger.error(f"Failed to get total articles count: {response.text}")
-            return 0
-
-        result = response.json()
+        query = f'query {{ {field}(limit: null) {{ count }} }}'
+        result = shopify_client.graphql(shop, access_token, query)
         if 'errors' in result:
-            logger.error(f"GraphQL errors in total articles count: {result['errors']}")
-            return 0
-
-        edges = result.get('data', {}).get('articles', {}).get('edges', [])
-        total_count = len(edges)
-        logger.info(f"Total articles count for {shop}: {total_count}")
-        
-        return total_count
+            logger.error(f"GraphQL errors in {field}: {result['errors']}")
+            return None
+        return int(result.get('data', {}).get(field, {}).get('count', 0))
     except Exception as e:
-        logger.error(f"Exception getting total articles count for {shop}: {str(e)}")
-        return 0
-
-def get_total_products_count(shop, access_token):
-    """Get total count of products in Shopify store via GraphQL"""
-    logger.info(f"Getting total products count for: {shop}")
-    try:
-        query = '''
-        query {
-          productsCount(limit: null) {
-            count
-          }
-        }
-        '''
-        url = f'https://{shop}/admin/api/2025-07/graphql.json'
-        headers = {
-            'Content-Type': 'application/json',
-            'X-Shopify-Access-Token': access_token
-        }
-        response = requests.post(url, json={'query': query}, headers=headers, timeout=15)
-        logger.info(f"Total products count API response status: {response.status_code}")
-
-        if response.status_code != 200:
-            logger.error(f"Failed to get total products count: {response.text}")
-            return 0
+        logger.error(f"Exception getting {field} for {shop}: {str(e)}")
+        return None
 
-        data = response.json().get('data', {})
-        count = int(data.get('productsCount', {}).get('count', 0))
-        logger.info(f"Total products count for {shop}: {count}")
-        return count
-    except Exception as e:
-        logger.error(f"Exception getting total products count for {shop}: {str(e)}")
-        return 0
+def run_bulk_content_query(shop, access_token, resource, timeout=BULK_OPERATION_TIMEOUT):
+    """Submit a bulkOperationRunQuery for pages or articles and poll until it finishes.
 
+    Returns the JSONL result URL ('' when the store has no items), or None if the operation could
+    not be started (e.g. another bulk query is already running for the shop). Raises
+    ContentFetchError if the operation fails or does not finish within `timeout` seconds.
+    """
+    mutation = '''
+    mutation runBulkQuery($query: String!) {
+      bulkOperationRunQuery(query: $query) {
+        bulkOperation { id status }
+        userErrors { field message }
+      }
+    }
+    '''
+    poll_query = '''
+    query bulkOperation($id: ID!) {
+      node(id: $id) {
+        ... on BulkOperation { id status errorCode objectCount url }
+      }
+    }
+    '''
+    result = shopify_client.graphql(shop, access_token, mutation, {'query': BULK_CONTENT_QUERIES[resource]})
+    payload = result.get('data', {}).get('bulkOperationRunQuery') or {}
+    if result.get('errors') or payload.get('userErrors') or not payload.get('bulkOperation'):
+        logger.warning(f"Could not start bulk {resource} query for {shop}: {result.get('errors') or payload.get('userErrors')}")
+        return None
 
-def get_total_collections_count(shop, access_token):
-    """Get total count of collections (custom + smart) via GraphQL"""
-    logger.info(f"Getting total collections count for: {shop}")
+    operation_id = payload['bulkOperation']['id']
+    logger.info(f"Started bulk {resource} query {operation_id} for {shop}")
+
+    deadline = time.monotonic() + timeout
+    delay = 1
+    while time.monotonic() < deadline:
+        time.sleep(delay)
+        delay = min(delay * 2, 10)
+        operation = shopify_client.graphql(shop, access_token, poll_query, {'id': operation_id}).get('data', {}).get('node') or {}
+        status = operation.get('status')
+        if status == 'COMPLETED':
+            logger.info(f"Bulk {resource} query for {shop} completed with {operation.get('objectCount')} objects")
+            return operation.get('url') or ''
+        if status in ('FAILED', 'CANCELED', 'EXPIRED'):
+            raise ContentFetchError(f"Bulk {resource} query {operation_id} ended with {status}: {operation.get('errorCode')}")
+
+    raise ContentFetchError(f"Bulk {resource} query {operation_id} did not finish within {timeout}s")
+
+def iter_bulk_content_results(url, shop_id, batch_size=100):
+    """Stream a bulk operation JSONL file line by line, yielding normalized items in batches.
+    Only one batch is held in memory at a time. A failed or interrupted download, or a line that is
+    not JSON, raises ContentFetchError."""
     try:
-        query = '''
-        query {
-            collectionsCount(limit: null) {
-                count
-            }
-            }
-        '''
-        url = f'https://{shop}/admin/api/2025-07/graphql.json'
-        headers = {
-            'Content-Type': 'application/json',
-            'X-Shopify-Access-Token': access_token
-        }
-        response = requests.post(url, json={'query': query}, headers=headers, timeout=15)
-
-        if response.status_code != 200:
-            logger.error(f"Failed to get collections count: {response.text}")
-            return 0
+        with requests.get(url, stream=True, timeout=(10, 60)) as response:
+            if response.status_code != 200:
+                raise ContentFetchError(f"Bulk result download failed with status {response.status_code}")
+            batch = []
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                batch.append(_normalize_content_node(json.loads(line), shop_id))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+    except (requests.RequestException, ValueError) as e:
+        raise ContentFetchError(f"Bulk result download failed: {str(e)}")
+
+def iter_content_batches(shop, access_token, resource, batch_size=100, mode=None, search_query=None):
+    """Yield batches of normalized pages or articles for a shop.
+
+    mode is 'paged' (cursor pagination through get_pages/get_articles) or 'bulk' (a Bulk Operation
+    streamed from its JSONL file). When omitted, stores with BULK_SYNC_THRESHOLD or more items use
+    bulk mode. Bulk mode falls back to paging if the operation cannot be started. A search_query
+    (e.g. updated_at:>'2025-01-01T00:00:00Z') narrows the listing and is always paged. Raises
+    ContentFetchError if the listing could not be completed.
+    """
+    if search_query:
+        mode = 'paged'
+    elif mode is None:
+        count = get_content_count(shop, access_token, resource)
+        mode = 'bulk' if count is not None and count >= BULK_SYNC_THRESHOLD else 'paged'
+        logger.info(f"Using {mode} ingestion for {count} {resource} of {shop}")
+
+    if mode == 'bulk':
+        url = run_bulk_content_query(shop, access_token, resource)
+        if url is not None:
+            if url:
+                shop_id = get_shop_details(shop, access_token).get('id')
+                yield from iter_bulk_content_results(url, shop_id, batch_size=batch_size)
+            return
+        logger.info(f"Falling back to paged ingestion of {resource} for {shop}")
+
+    fetch = get_pages if resource == 'pages' else get_articles
+    cursor = None
+    while True:
+        result = fetch(shop, access_token, cursor=cursor, limit=batch_size, search_query=search_query)
+        if result.get('error'):
+            raise ContentFetchError(result['error'])
+        items = result.get(resource, [])
+        if items:
+            yield items
+        if not result.get('has_next'):
+            break
+        cursor = result.get('end_cursor')
+
+DASHBOARD_QUERY = '''
+query {
+  shop { name }
+  currentAppInstallation {
+    activeSubscriptions { id name status }
+  }
+  pages: pagesCount(limit: null) { count }
+  articles: articlesCount(limit: null) { count }
+  products: productsCount(limit: null) { count }
+  collections: collectionsCount(limit: null) { count }
+}
+'''
 
-        data = response.json().get('data', {})
-        count = int(data.get('collectionsCount', {}).get('count', 0))
-        logger.info(f"Total collections count for {shop}: {count}")
-        return count
+def get_dashboard_data(shop, access_token):
+    """Everything the dashboards show from Shopify in one aliased GraphQL query: exact page, article,
+    product and collection counts, the shop name and the active subscription status.
+    Returns {'pages', 'articles', 'products', 'collections', 'shop_name', 'subscription_status',
+    'subscription_name'}, or None if the query failed."""
+    logger.info(f"Getting dashboard data for: {shop}")
+    try:
+        result = shopify_client.graphql(shop, access_token, DASHBOARD_QUERY)
+        if 'errors' in result:
+            logger.error(f"GraphQL errors in dashboard data: {result['errors']}")
+            return None
+        data = result.get('data') or {}
+        dashboard = {key: int((data.get(key) or {}).get('count') or 0) for key in ('pages', 'articles', 'products', 'collections')}
+        subscriptions = (data.get('currentAppInstallation') or {}).get('activeSubscriptions') or []
+        dashboard['shop_name'] = (data.get('shop') or {}).get('name')
+        dashboard['subscription_status'] = subscriptions[0].get('status') if subscriptions else None
+        dashboard['subscription_name'] = subscriptions[0].get('name') if subscriptions else None
+        logger.info(f"Dashboard data for {shop}: {dashboard}")
+        return dashboard
     except Exception as e:
-        logger.error(f"Exception getting total collections count for {shop}: {str(e)}")
-        return 0
-
+        logger.error(f"Exception getting dashboard data for {shop}: {str(e)}")
+        return None
 
 def verify_shopify_hmac(query_params, hmac_to_verify):
     """Verify Shopify HMAC for embedded app requests"""
@@ -506,13 +498,6 @@ def save_aerochat_script_id(shop, access_token, script_id):
     """
     logger.info(f"Saving AeroChat script_id metafield for: {shop}")
     try:
-        url = f"https://{shop}/admin/api/2025-01/metafields.json"
-
-        headers = {
-            "Content-Type": "application/json",
-            "X-Shopify-Access-Token": access_token
-        }
-
         payload = {
             "metafield": {
                 "namespace": "aerochat",
@@ -523,7 +508,7 @@ def save_aerochat_script_id(shop, access_token, script_id):
             }
         }
 
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
+        response = shopify_client.rest_post(shop, access_token, 'metafields.json', payload)
         
         if response.status_code == 201:
             metafield_data = response.json().get("metafield")
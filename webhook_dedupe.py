@@ -0,0 +1,84 @@
+# webhook_dedupe.py
+import time
+import threading
+from collections import OrderedDict
+from config import logger, WEBHOOK_DEDUPE_TTL, WEBHOOK_DEDUPE_CACHE_SIZE
+from database import db
+
+class WebhookDedupe:
+    """Webhook intake: queues deliveries and recognizes Shopify redeliveries by X-Shopify-Webhook-Id.
+
+    Deliveries are stored in the webhook_deliveries table, shared by every process, which keeps
+    their ids for ttl seconds (Shopify stops retrying well within that). An in-process LRU of
+    recently seen ids answers most redeliveries without a database round trip. Rows past the TTL are purged at
+    most once per cleanup_interval seconds. Counts deliveries and duplicates per topic.
+    """
+    def __init__(self, max_size=WEBHOOK_DEDUPE_CACHE_SIZE, ttl=WEBHOOK_DEDUPE_TTL, cleanup_interval=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._seen = OrderedDict()  # webhook_id -> first seen (monotonic), most recent last
+        self._lock = threading.Lock()
+        self._stats = {}  # topic -> {'received', 'duplicates'}
+        self._last_cleanup = 0.0
+
+    def accept(self, webhook_id, topic, shop_domain, payload, **queue_options):
+        """Queue a webhook delivery (queue_options go to db.queue_webhook). Returns True if it was
+        queued, False for a redelivery of an accepted webhook_id, and None if it could not be stored."""
+        if self._seen_recently(webhook_id):
+            queued = False
+        else:
+            queued = db.queue_webhook(webhook_id, topic, shop_domain, payload, **queue_options)
+            if queued is not None:
+                self._remember(webhook_id)
+        if queued is not None:
+            self._count(topic, not queued)
+        self._maybe_cleanup()
+        return queued
+
+    def _seen_recently(self, webhook_id):
+        with self._lock:
+            seen_at = self._seen.get(webhook_id)
+            if seen_at is None:
+                return False
+            if time.monotonic() - seen_at > self.ttl:
+                del self._seen[webhook_id]
+                return False
+            self._seen.move_to_end(webhook_id)
+            return True
+
+    def _remember(self, webhook_id):
+        with self._lock:
+            self._seen[webhook_id] = time.monotonic()
+            self._seen.move_to_end(webhook_id)
+            while len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+
+    def _count(self, topic, duplicate):
+        with self._lock:
+            stats = self._stats.setdefault(topic, {'received': 0, 'duplicates': 0})
+            stats['received'] += 1
+            if duplicate:
+                stats['duplicates'] += 1
+
+    def _maybe_cleanup(self):
+        with self._lock:
+            if time.monotonic() - self._last_cleanup < self.cleanup_interval:
+                return
+            self._last_cleanup = time.monotonic()
+        threading.Thread(target=self._cleanup, name='webhook-dedupe-cleanup', daemon=True).start()
+
+    def _cleanup(self):
+        purged = db.purge_webhook_deliveries(self.ttl)
+        if purged:
+            logger.info(f"Purged {purged} webhook deliveries older than {self.ttl}s")
+
+    def stats(self):
+        """Deliveries, duplicates and duplicate rate per topic"""
+        with self._lock:
+            stats = {topic: dict(counts) for topic, counts in self._stats.items()}
+        for counts in stats.values():
+            counts['duplicate_rate'] = round(counts['duplicates'] / counts['received'], 4) if counts['received'] else None
+        return stats
+
+webhook_dedupe = WebhookDedupe()
@@ -0,0 +1,88 @@
+# webhook_queue.py
+import json
+import threading
+from config import logger, WEBHOOK_WORKERS, WEBHOOK_BATCH_SIZE, WEBHOOK_MAX_ATTEMPTS
+from database import db
+from webhook_routes import WEBHOOK_PROCESSORS, InvalidWebhook
+
+def _coalesce(events):
+    """Group claimed events (oldest first) by shop, topic and the topic's coalesce key. Returns
+    (latest event, superseded events) pairs ordered by when their latest event arrived."""
+    groups = {}
+    for position, event in enumerate(events):
+        processor = WEBHOOK_PROCESSORS.get(event['topic'])
+        key_fn = processor[1] if processor else None
+        key = key_fn(event['data']) if key_fn and event['data'] is not None else event['webhook_id']
+        group = groups.setdefault((event['shop_domain'], event['topic'], key), [])
+        group.append((position, event))
+    ordered = sorted(groups.values(), key=lambda group: group[-1][0])
+    return [(group[-1][1], [event for _, event in group[:-1]]) for group in ordered]
+
+def process_events(events, retry_base=30, max_attempts=WEBHOOK_MAX_ATTEMPTS):
+    """Process claimed webhook events. Only the latest of each coalesced group runs; once one of a
+    shop's events fails, its later events in the batch wait for the retry as well."""
+    for event in events:
+        try:
+            event['data'] = json.loads(event['payload']) if event['payload'] else {}
+        except ValueError:
+            event['data'] = None
+
+    failed_shops = set()
+    for event, superseded in _coalesce(events):
+        webhook_id, topic, shop_domain = event['webhook_id'], event['topic'], event['shop_domain']
+        if superseded:
+            db.finish_webhook_events([e['webhook_id'] for e in superseded], status='coalesced')
+            logger.info(f"Coalesced {len(superseded)} earlier {topic} webhooks for {shop_domain} into {webhook_id}")
+        if shop_domain in failed_shops:
+            db.release_webhook_events([webhook_id])
+            continue
+        try:
+            if topic not in WEBHOOK_PROCESSORS:
+                raise InvalidWebhook(f"No processor for webhook topic {topic}")
+            if event['data'] is None:
+                raise InvalidWebhook("Webhook payload is not valid JSON")
+            WEBHOOK_PROCESSORS[topic][0](shop_domain, event['data'])
+            db.finish_webhook_events([webhook_id])
+        except InvalidWebhook as e:
+            logger.error(f"Dropping {topic} webhook {webhook_id} for {shop_domain}: {str(e)}")
+            db.fail_webhook_event(webhook_id, str(e))
+        except Exception as e:
+            failed_shops.add(shop_domain)
+            retry_delay = retry_base * (2 ** (event['attempts'] - 1))
+            status = db.fail_webhook_event(webhook_id, str(e), retry_delay=retry_delay, max_attempts=max_attempts)
+            logger.error(f"{topic} webhook {webhook_id} for {shop_domain} failed: {str(e)}; now {status}")
+
+class WebhookWorkerPool:
+    """Daemon threads that process webhooks queued in webhook_deliveries. Claims use SKIP LOCKED,
+    so any number of processes can run a pool against the same database."""
+    def __init__(self, size=WEBHOOK_WORKERS, batch_size=WEBHOOK_BATCH_SIZE, poll_interval=1.0):
+        self.size = size
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _loop(self):
+        while not self._stop.is_set():
+            events = db.claim_webhook_events(limit=self.batch_size)
+            if not events:
+                self._stop.wait(self.poll_interval)
+                continue
+            process_events(events)
+
+    def start(self):
+        if self._threads or self.size <= 0:
+            return
+        for i in range(self.size):
+            thread = threading.Thread(target=self._loop, name=f'webhook-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.size} webhook workers")
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+webhook_workers = WebhookWorkerPool()
@@ -1,11 +1,22 @@
 # webhook_routes.py
 from flask import request, jsonify
+import uuid
 import hmac
 import hashlib
 import base64
 import requests
-from config import logger, datetime, json, API_SECRET, THIRD_PARTY_API_URL
-from database import db
+from config import logger, json, API_SECRET, THIRD_PARTY_API_URL, CONTENT_WEBHOOK_DEBOUNCE, CONTENT_WEBHOOK_MAX_WAIT
+from database import db, content_fingerprint
+from dashboard_data import dashboard_data
+from webhook_dedupe import webhook_dedupe
+from content_sync import push_message
+
+class InvalidWebhook(Exception):
+    """Raised by a webhook processor for a payload that can never be processed; it is not retried"""
+
+def _valid_webhook_hmac(data, hmac_header):
+    computed_hmac = base64.b64encode(hmac.new(API_SECRET.encode('utf-8'), data, hashlib.sha256).digest()).decode()
+    return hmac.compare_digest(computed_hmac, hmac_header or '')
 
 def delete_shop_data(shop_domain):
     """Hard-delete shop and related subscriptions. Safe to comment out when not needed."""
@@ -18,229 +29,282 @@ def delete_shop_data(shop_domain):
         return False
 
 def notify_third_party_unsubscribe(shop_domain):
-    """Call AeroChat unsubscribe API. Safe to comment out the call site if needed."""
+    """Call AeroChat unsubscribe API. Returns True on success; delivered through the outbox."""
     try:
         if not shop_domain:
-            return
+            return True
         api_url = 'https://app.aerochat.ai/chat/api/v2/unsubscribe'
         payload = {'store_url': shop_domain}
         response = requests.post(api_url, json=payload, timeout=15)
         logger.info(f"Unsubscribe API status {response.status_code} for {shop_domain}")
         if response.status_code >= 400:
             logger.error(f"Unsubscribe API failed for {shop_domain}: {response.text}")
+            return False
+        return True
     except requests.exceptions.RequestException as api_err:
         logger.error(f"Unsubscribe API error for {shop_domain}: {str(api_err)}")
+        return False
     except Exception as e:
         logger.error(f"Unexpected error calling unsubscribe API for {shop_domain}: {str(e)}")
+        return False
 
-def uninstall_webhook():
-    """Handle app uninstallation webhook"""
-    logger.info("App uninstall webhook received")
-    
+def notify_third_party_subscription(payload):
+    """Create/update the AeroChat user for an active subscription. Returns True on success; delivered through the outbox."""
     try:
-        # Verify HMAC
-        hmac_header = request.headers.get('X-Shopify-Hmac-Sha256')
-        data = request.get_data()
-        computed_hmac = base64.b64encode(hmac.new(API_SECRET.encode('utf-8'), data, hashlib.sha256).digest()).decode()
-        
-        if not hmac.compare_digest(computed_hmac, hmac_header):
-            logger.error("Invalid uninstall webhook HMAC verification failed")
-            return jsonify({'error': 'Invalid webhook HMAC'}), 401
-
-        webhook_data = request.json
-        shop_domain = request.headers.get('X-Shopify-Shop-Domain')
-        
-        logger.info(f"Processing uninstall webhook for shop: {shop_domain}")
-        logger.info(f"Uninstall webhook data: {json.dumps(webhook_data, indent=2)}")
-
-        # Clean up shop data (soft-delete/mark as uninstalled)
-        if shop_domain:
-            # Update shop record to mark as uninstalled
-            db.create_or_update_shop(shop_domain,
-                                     status='uninstalled',
-                                     uninstalled_at=datetime.now().isoformat())
-            logger.info(f"Marked shop {shop_domain} as uninstalled")
-
-            # Third-party unsubscribe (safe, non-blocking). Comment out next line to disable.
-            notify_third_party_unsubscribe(shop_domain)
-
-            # Optional: Hard delete data from our DB
-            delete_shop_data(shop_domain)
-            
-            # You could also call a third-party API to handle uninstallation
-            # notify_third_party_uninstall(shop_domain)
-            # try:
-            #     api_url = 'https://aerochat-staging.dummywebdemo.xyz/chat/api/unsubscribe'  # Replace with actual URL
-            #     payload = {'store_url': shop_domain}
-            #     response = requests.post(api_url, json=payload, timeout=5)  # Timeout to avoid blocking
-            #     response.raise_for_status()
-            #     logger.info(f"Third-party API called successfully for {shop_domain}")
-            # except requests.exceptions.RequestException as api_err:
-            #     logger.error(f"Third-party API call failed for {shop_domain}: {str(api_err)}")
-            # Don't fail the webhook—log and proceed
-        return jsonify({'status': 'success'}), 200
-        
+        third_party_response = requests.post(THIRD_PARTY_API_URL, json=payload, timeout=10)
+
+        logger.info(f"Third-party API response status: {third_party_response.status_code}")
+        logger.info(f"Third-party API response body: {third_party_response.text}")
+
+        if third_party_response.status_code != 200:
+            logger.error(f'Third-party API call failed: Status {third_party_response.status_code}, Response: {third_party_response.text}')
+            return False
+        logger.info("Third-party API call successful")
+        return True
+    except requests.exceptions.Timeout:
+        logger.error("Third-party API call timed out")
+        return False
     except Exception as e:
-        logger.error(f"Error in uninstall webhook: {str(e)}")
-        return jsonify({'error': 'Uninstall webhook processing failed'}), 500
+        logger.error(f'Error calling third-party API: {str(e)}')
+        return False
+
+# Shopify topic header -> (resource, action) for page/article webhooks
+CONTENT_TOPICS = {
+    'pages/create': ('pages', 'upsert'),
+    'pages/update': ('pages', 'upsert'),
+    'pages/delete': ('pages', 'delete'),
+    'articles/create': ('articles', 'upsert'),
+    'articles/update': ('articles', 'upsert'),
+    'articles/delete': ('articles', 'delete'),
+}
+
+def _accept_webhook(topic, **queue_options):
+    """Phase one of every webhook: verify the HMAC, persist the raw payload to webhook_deliveries
+    and acknowledge. webhook_queue.WebhookWorkerPool processes it. Redeliveries of an accepted
+    X-Shopify-Webhook-Id are acknowledged without being queued again."""
+    data = request.get_data()
+    if not _valid_webhook_hmac(data, request.headers.get('X-Shopify-Hmac-Sha256')):
+        logger.error(f"Invalid {topic} webhook HMAC verification failed")
+        return jsonify({'error': 'Invalid webhook HMAC'}), 401
+
+    webhook_id = request.headers.get('X-Shopify-Webhook-Id') or f'local-{uuid.uuid4()}'
+    shop_domain = request.headers.get('X-Shopify-Shop-Domain')
+    queued = webhook_dedupe.accept(webhook_id, topic, shop_domain, data.decode('utf-8', errors='replace'), **queue_options)
+    if queued is None:
+        # Nothing was stored; Shopify retries on a non-2xx response
+        return jsonify({'error': 'Failed to queue webhook'}), 500
+    if not queued:
+        logger.info(f"Duplicate {topic} webhook {webhook_id} acknowledged without processing")
+        return jsonify({'status': 'duplicate'}), 200
+    logger.info(f"Queued {topic} webhook {webhook_id} for {shop_domain}")
+    return jsonify({'status': 'queued'}), 200
+
+def uninstall_webhook():
+    """Handle app uninstallation webhook"""
+    return _accept_webhook('app/uninstalled')
 
 def subscription_webhook():
-    logger.info("Subscription webhook received")
-    
-    try:
-        # Verify HMAC
-        hmac_header = request.headers.get('X-Shopify-Hmac-Sha256')
-        data = request.get_data()
-        computed_hmac = base64.b64encode(hmac.new(API_SECRET.encode('utf-8'), data, hashlib.sha256).digest()).decode()
-        
-        if not hmac.compare_digest(computed_hmac, hmac_header):
-            logger.error("Invalid webhook HMAC verification failed")
-            return jsonify({'error': 'Invalid webhook HMAC'}), 401
-
-        webhook_data = request.json
-        shop_domain = request.headers.get('X-Shopify-Shop-Domain', 'unknown.myshopify.com')
-        
-        logger.info(f"Processing webhook for shop: {shop_domain}")
-        logger.info(f"Webhook data: {json.dumps(webhook_data, indent=2)}")
-
-        subscription = webhook_data.get('app_subscription')
-        if not subscription:
-            logger.error("Missing app_subscription in webhook data")
-            return jsonify({'error': 'Missing app_subscription in webhook data'}), 400
-
-        # Get shop data from database
-        shop_data = db.get_shop(shop_domain)
-        logger.info(f"Shop data from database: {json.dumps(shop_data, indent=2, default=str)}")
-
-        if not shop_data:
-            logger.error(f"No shop data found for: {shop_domain}")
-            # Try to create minimal shop record
-            db.create_or_update_shop(shop_domain)
-            shop_data = db.get_shop(shop_domain)
-
-        # Update subscription in database
-        db.create_or_update_subscription(shop_domain, subscription)
-        ## To check if the subscription is active
-        status = (subscription.get('status') or '').upper()
-        logger.info(f"Subscription status: {status}")
-        if status in ['DECLINED', 'PENDING', 'EXPIRED', 'CANCELLED']:
-            logger.info(f"Skipping third-party API call because subscription status is {status}")
-            return jsonify({'status': 'ignored_non_active_subscription'}), 200
-        # Prepare data for third-party API
-        email = shop_data.get('email', 'support+test52@aerochat.ai')
-        print(f"Email: {email}")
-        store_url = shop_data.get('store_url', shop_domain.replace('.myshopify.com', ''))
-        
-        plan_name = subscription.get('name', 'Unknown').strip()
-        
-        # Extract interval from lineItems if available
-        interval = 'unknown'
-        line_items = subscription.get('lineItems', [])
-        print(f"Line items: {line_items}")
-        if line_items and len(line_items) > 0:
-            plan_data = line_items[0].get('plan', {})
-            if plan_data.get('__typename') == 'AppRecurringPricing':
-                interval = plan_data.get('interval', 'unknown')
-        if not line_items or interval == 'unknown' or not interval:
-            try:
-                active_sub = db.get_active_subscription(shop_domain)
-                if active_sub and active_sub.get('interval'):
-                    interval = active_sub.get('interval')
-            except Exception as _e:
-                logger.error(f"Failed to get interval from DB for {shop_domain}: {str(_e)}")
-
-        # Normalize interval to display label
-        interval_lc = (interval or '').lower()
-        if interval_lc in ['every_30_days', 'monthly', 'month']:
-            interval_label = 'Monthly'
-        elif interval_lc in ['annual', 'yearly', 'year']:
-            interval_label = 'Yearly'
-        else:
-            interval_label = 'Unknown'
-
-        plan_id = f'{plan_name} | {interval_label} Plan'
-
-        payload = {
-            'email': email,
-            'store_url': f'{store_url}.myshopify.com',
-            'plan_id': plan_id
-        }
-
-        logger.info(f"Calling third-party API with payload: {json.dumps(payload, indent=2)}")
-
-        # Call third-party API
-        try:
-            third_party_response = requests.post(THIRD_PARTY_API_URL, json=payload, timeout=10)
-            
-            logger.info(f"Third-party API response status: {third_party_response.status_code}")
-            logger.info(f"Third-party API response body: {third_party_response.text}")
-            
-            if third_party_response.status_code != 200:
-                logger.error(f'Third-party API call failed: Status {third_party_response.status_code}, Response: {third_party_response.text}')
-            else:
-                logger.info("Third-party API call successful")
-                
-        except requests.exceptions.Timeout:
-            logger.error("Third-party API call timed out")
-        except Exception as e:
-            logger.error(f'Error calling third-party API: {str(e)}')
-
-        # Log final database state
-        #db.log_database_state()
-
-        return jsonify({'status': 'success'}), 200
-        
-    except Exception as e:
-        logger.error(f"Error in subscription webhook: {str(e)}")
-        return jsonify({'error': 'Webhook processing failed'}), 500
+    return _accept_webhook('app_subscriptions/update')
+
+def content_webhook():
+    """Page/article create, update and delete webhooks. A shop's burst of changes is debounced and
+    then applied together."""
+    topic = request.headers.get('X-Shopify-Topic')
+    if topic not in CONTENT_TOPICS:
+        return jsonify({'error': f'Unsupported content webhook topic: {topic}'}), 400
+    return _accept_webhook(topic, debounce=CONTENT_WEBHOOK_DEBOUNCE, debounce_topics=list(CONTENT_TOPICS),
+                           max_wait=CONTENT_WEBHOOK_MAX_WAIT)
 
 def customers_data_request_webhook():
     """GDPR: customers/data_request - verify HMAC and return 200"""
-    logger.info("GDPR customers/data_request webhook received")
-    try:
-        hmac_header = request.headers.get('X-Shopify-Hmac-Sha256')
-        data = request.get_data()
-        computed_hmac = base64.b64encode(hmac.new(API_SECRET.encode('utf-8'), data, hashlib.sha256).digest()).decode()
-        if not hmac.compare_digest(computed_hmac, hmac_header or ''):
-            logger.error("Invalid HMAC for customers/data_request")
-            return jsonify({'error': 'Invalid webhook HMAC'}), 401
-
-        logger.info(f"customers/data_request payload: {json.dumps(request.json or {}, indent=2)}")
-        return jsonify({'status': 'ok'}), 200
-    except Exception as e:
-        logger.error(f"Error in customers/data_request webhook: {str(e)}")
-        return jsonify({'error': 'Webhook processing failed'}), 500
+    return _accept_webhook('customers/data_request')
 
 def customers_redact_webhook():
     """GDPR: customers/redact - verify HMAC and return 200"""
-    logger.info("GDPR customers/redact webhook received")
-    try:
-        hmac_header = request.headers.get('X-Shopify-Hmac-Sha256')
-        data = request.get_data()
-        computed_hmac = base64.b64encode(hmac.new(API_SECRET.encode('utf-8'), data, hashlib.sha256).digest()).decode()
-        if not hmac.compare_digest(computed_hmac, hmac_header or ''):
-            logger.error("Invalid HMAC for customers/redact")
-            return jsonify({'error': 'Invalid webhook HMAC'}), 401
-
-        logger.info(f"customers/redact payload: {json.dumps(request.json or {}, indent=2)}")
-        return jsonify({'status': 'ok'}), 200
-    except Exception as e:
-        logger.error(f"Error in customers/redact webhook: {str(e)}")
-        return jsonify({'error': 'Webhook processing failed'}), 500
+    return _accept_webhook('customers/redact')
 
 def shop_redact_webhook():
     """GDPR: shop/redact - verify HMAC and return 200"""
-    logger.info("GDPR shop/redact webhook received")
-    try:
-        hmac_header = request.headers.get('X-Shopify-Hmac-Sha256')
-        data = request.get_data()
-        computed_hmac = base64.b64encode(hmac.new(API_SECRET.encode('utf-8'), data, hashlib.sha256).digest()).decode()
-        if not hmac.compare_digest(computed_hmac, hmac_header or ''):
-            logger.error("Invalid HMAC for shop/redact")
-            return jsonify({'error': 'Invalid webhook HMAC'}), 401
-
-        logger.info(f"shop/redact payload: {json.dumps(request.json or {}, indent=2)}")
-        return jsonify({'status': 'ok'}), 200
-    except Exception as e:
-        logger.error(f"Error in shop/redact webhook: {str(e)}")
-        return jsonify({'error': 'Webhook processing failed'}), 500
\ No newline at end of file
+    return _accept_webhook('shop/redact')
+
+def process_uninstall(shop_domain, webhook_data):
+    """Phase two of app/uninstalled"""
+    logger.info(f"Processing uninstall webhook for shop: {shop_domain}")
+    logger.info(f"Uninstall webhook data: {json.dumps(webhook_data)}")
+
+    # Clean up shop data (soft-delete/mark as uninstalled)
+    if not shop_domain:
+        return
+    # Update shop record to mark as uninstalled; the AeroChat unsubscribe is queued in the
+    # same transaction and sent by the outbox dispatcher
+    if not db.create_or_update_shop(shop_domain,
+                                    status='uninstalled',
+                                    outbox=[('unsubscribe', {'store_url': shop_domain})]):
+        raise RuntimeError(f"Failed to mark shop {shop_domain} as uninstalled")
+    logger.info(f"Marked shop {shop_domain} as uninstalled")
+
+    # Optional: Hard delete data from our DB
+    delete_shop_data(shop_domain)
+    dashboard_data.forget(shop_domain)
+
+def process_subscription(shop_domain, webhook_data):
+    """Phase two of app_subscriptions/update"""
+    shop_domain = shop_domain or 'unknown.myshopify.com'
+    logger.info(f"Processing webhook for shop: {shop_domain}")
+    logger.info(f"Webhook data: {json.dumps(webhook_data)}")
+
+    subscription = webhook_data.get('app_subscription')
+    if not subscription:
+        raise InvalidWebhook("Missing app_subscription in webhook data")
+
+    # Get shop data from database
+    shop_data = db.get_shop(shop_domain)
+    logger.info(f"Shop data from database: {json.dumps(shop_data, default=str)}")
+
+    if not shop_data:
+        logger.error(f"No shop data found for: {shop_domain}")
+        # Try to create minimal shop record
+        db.create_or_update_shop(shop_domain)
+        shop_data = db.get_shop(shop_domain) or {}
+
+    ## To check if the subscription is active
+    status = (subscription.get('status') or '').upper()
+    logger.info(f"Subscription status: {status}")
+    if status in ['DECLINED', 'PENDING', 'EXPIRED', 'CANCELLED']:
+        if not db.create_or_update_subscription(shop_domain, subscription):
+            raise RuntimeError(f"Failed to record subscription for {shop_domain}")
+        logger.info(f"Skipping third-party API call because subscription status is {status}")
+        return
+    # Prepare data for third-party API
+    email = shop_data.get('email', 'support+test52@aerochat.ai')
+    store_url = shop_data.get('store_url', shop_domain.replace('.myshopify.com', ''))
+
+    plan_name = subscription.get('name', 'Unknown').strip()
+
+    # Extract interval from lineItems if available
+    interval = 'unknown'
+    line_items = subscription.get('lineItems', [])
+    if line_items and len(line_items) > 0:
+        plan_data = line_items[0].get('plan', {})
+        if plan_data.get('__typename') == 'AppRecurringPricing':
+            interval = plan_data.get('interval', 'unknown')
+    if (not line_items or interval == 'unknown' or not interval) and subscription.get('interval'):
+        interval = subscription.get('interval')
+    if not line_items or interval == 'unknown' or not interval:
+        try:
+            active_sub = db.get_active_subscription(shop_domain)
+            if active_sub and active_sub.get('interval'):
+                interval = active_sub.get('interval')
+        except Exception as _e:
+            logger.error(f"Failed to get interval from DB for {shop_domain}: {str(_e)}")
+
+    # Normalize interval to display label
+    interval_lc = (interval or '').lower()
+    if interval_lc in ['every_30_days', 'monthly', 'month']:
+        interval_label = 'Monthly'
+    elif interval_lc in ['annual', 'yearly', 'year']:
+        interval_label = 'Yearly'
+    else:
+        interval_label = 'Unknown'
+
+    plan_id = f'{plan_name} | {interval_label} Plan'
+
+    payload = {
+        'email': email,
+        'store_url': f'{store_url}.myshopify.com',
+        'plan_id': plan_id
+    }
+
+    # Update subscription in database; the AeroChat call is queued in the same transaction
+    logger.info(f"Queueing third-party API call with payload: {json.dumps(payload)}")
+    if not db.create_or_update_subscription(shop_domain, subscription, outbox=[('subscription', payload)]):
+        raise RuntimeError(f"Failed to record subscription for {shop_domain}")
+
+def _numeric_content_id(webhook_data):
+    """The numeric REST id of a page/article webhook. Delete payloads carry only this id, and
+    admin_graphql_api_id uses OnlineStorePage/OnlineStoreArticle gids rather than the Page/Article
+    gids sync stores, so the stored id is always built from it."""
+    webhook_data = webhook_data or {}
+    item_id = webhook_data.get('id')
+    if not item_id and webhook_data.get('admin_graphql_api_id'):
+        item_id = str(webhook_data['admin_graphql_api_id']).rsplit('/', 1)[-1]
+    return str(item_id) if item_id else None
+
+def _content_item(resource, webhook_data, shop_data):
+    """Map a page/article webhook payload onto the dict shape sync stores (gid://shopify/Page/N ids)"""
+    numeric_id = _numeric_content_id(webhook_data)
+    if not numeric_id:
+        raise InvalidWebhook(f"{resource} webhook without an id")
+    return {
+        'id': f"gid://shopify/{'Page' if resource == 'pages' else 'Article'}/{numeric_id}",
+        'title': webhook_data.get('title'),
+        'handle': webhook_data.get('handle'),
+        'body': webhook_data.get('body_html'),
+        'created_at': webhook_data.get('created_at'),
+        'updated_at': webhook_data.get('updated_at'),
+        'published_at': webhook_data.get('published_at'),
+        'published': bool(webhook_data.get('published_at')),
+        'store_id': shop_data.get('shop_id'),
+        'company_id': shop_data.get('company_id'),
+    }
+
+def _content_processor(resource, action):
+    """Apply one page/article webhook as a single-item delta: the same upsert and delete the full
+    sync uses, with the AeroChat push or delete queued in the outbox in the same transaction"""
+    save = db.save_pages if resource == 'pages' else db.save_articles
+    get_stored = db.get_stored_pages if resource == 'pages' else db.get_stored_articles
+    delete_ids = db.delete_pages_by_ids if resource == 'pages' else db.delete_articles_by_ids
+
+    def process(shop_domain, webhook_data):
+        shop_data = db.get_shop(shop_domain)
+        if not shop_data or shop_data.get('status') == 'uninstalled':
+            logger.info(f"Ignoring {resource} webhook for unknown or uninstalled shop {shop_domain}")
+            return
+        company_id = shop_data.get('company_id')
+        item = _content_item(resource, webhook_data, shop_data)
+
+        if action == 'delete':
+            outbox = [(f'delete_{resource}', {'company_id': company_id, 'ids': [item['id']]})] if company_id else None
+            if delete_ids(shop_domain, [item['id']], outbox=outbox):
+                dashboard_data.invalidate(shop_domain)
+            return
+
+        stored = get_stored(shop_domain, ids=[item['id']])
+        if stored is None:
+            raise RuntimeError(f"Failed to load stored {resource} {item['id']} for {shop_domain}")
+        if stored and stored[0].get('content_hash') == content_fingerprint(item):
+            return  # e.g. a metafield edit; nothing AeroChat indexes changed
+        if stored and stored[0].get('chunk_ids') is not None:
+            item['chunk_ids'] = stored[0]['chunk_ids']
+        outbox = [push_message(resource, company_id, [item])] if company_id else None
+        if not save(shop_domain, [item], company_id=company_id, outbox=outbox):
+            raise RuntimeError(f"Failed to save {resource} {item['id']} for {shop_domain}")
+        if not stored:
+            dashboard_data.invalidate(shop_domain)
+    return process
+
+def _content_key(webhook_data):
+    return _numeric_content_id(webhook_data)
+
+def _gdpr_processor(topic):
+    def process(shop_domain, webhook_data):
+        logger.info(f"{topic} payload for {shop_domain}: {json.dumps(webhook_data or {})}")
+    return process
+
+def _subscription_key(webhook_data):
+    subscription = (webhook_data or {}).get('app_subscription') or {}
+    return subscription.get('admin_graphql_api_id') or subscription.get('id')
+
+# topic -> (process(shop_domain, webhook_data), coalesce key). Queued events of a shop with the same
+# topic and key are coalesced: only the latest is processed. A key function of None never coalesces;
+# a constant key coalesces every event of the topic.
+WEBHOOK_PROCESSORS = {
+    'app/uninstalled': (process_uninstall, lambda webhook_data: 'shop'),
+    'app_subscriptions/update': (process_subscription, _subscription_key),
+    'customers/data_request': (_gdpr_processor('customers/data_request'), None),
+    'customers/redact': (_gdpr_processor('customers/redact'), None),
+    'shop/redact': (_gdpr_processor('shop/redact'), None),
+}
+WEBHOOK_PROCESSORS.update({
+    topic: (_content_processor(resource, action), _content_key) for topic, (resource, action) in CONTENT_TOPICS.items()
+})
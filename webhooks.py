@@ -1,19 +1,24 @@
 # webhooks.py
-import requests
-from flask import request, jsonify
-from config import logger, datetime, json, API_SECRET, REDIRECT_URI
-from database import db
+from config import logger, json, REDIRECT_URI, CONTENT_WEBHOOK_TOPICS
+from shopify_client import shopify_client
+
+def _existing_webhooks(shop, access_token, check_query, variables=None):
+    """Return the webhookSubscriptions edges for check_query. If the check fails, log it and return
+    an empty list so the caller still attempts the create; a duplicate create only comes back as a
+    userError."""
+    try:
+        result = shopify_client.graphql(shop, access_token, check_query, variables)
+        return ((result.get('data') or {}).get('webhookSubscriptions') or {}).get('edges') or []
+    except Exception as e:
+        logger.warning(f"Could not check existing webhooks for {shop}, attempting create: {str(e)}")
+        return []
 
 def register_uninstall_webhook(shop, access_token):
     """Register webhook for app uninstallation"""
     logger.info(f"Registering uninstall webhook for: {shop}")
     
     try:
-        graphql_url = f'https://{shop}/admin/api/2025-01/graphql.json'
-        headers = {
-            'Content-Type': 'application/json',
-            'X-Shopify-Access-Token': access_token
-        }
+        webhook_url = f"{REDIRECT_URI.replace('/oauth/callback', '/webhooks/uninstall')}"
 
         # Check if uninstall webhook already exists
         check_query = '''
@@ -29,20 +34,14 @@ def register_uninstall_webhook(shop, access_token):
         }
         '''
 
-        response = requests.post(graphql_url, json={'query': check_query}, headers=headers)
-        
-        if response.status_code == 200:
-            result = response.json()
-            existing_webhooks = result.get('data', {}).get('webhookSubscriptions', {}).get('edges', [])
-            
-            webhook_url = f"{REDIRECT_URI.replace('/oauth/callback', '/webhooks/uninstall')}"
-            
-            # Check if our webhook already exists
-            for webhook_edge in existing_webhooks:
-                webhook = webhook_edge.get('node', {})
-                if webhook.get('callbackUrl') == webhook_url:
-                    logger.info(f"Uninstall webhook already exists for {shop}: {webhook.get('id')}")
-                    return True
+        existing_webhooks = _existing_webhooks(shop, access_token, check_query)
+
+        # Check if our webhook already exists
+        for webhook_edge in existing_webhooks:
+            webhook = webhook_edge.get('node', {})
+            if webhook.get('callbackUrl') == webhook_url:
+                logger.info(f"Uninstall webhook already exists for {shop}: {webhook.get('id')}")
+                return True
 
         # Create new uninstall webhook
         mutation = '''
@@ -71,17 +70,7 @@ def register_uninstall_webhook(shop, access_token):
 
         logger.info(f"Creating uninstall webhook with URL: {webhook_url}")
         
-        response = requests.post(
-            graphql_url, 
-            json={'query': mutation, 'variables': variables}, 
-            headers=headers
-        )
-
-        if response.status_code != 200:
-            logger.error(f"Failed to create uninstall webhook: {response.text}")
-            return False
-
-        result = response.json()
+        result = shopify_client.graphql(shop, access_token, mutation, variables)
         
         if 'errors' in result:
             logger.error(f"GraphQL errors creating uninstall webhook: {result['errors']}")
@@ -111,11 +100,7 @@ def register_subscription_webhook(shop, access_token):
     logger.info(f"Registering subscription webhook for: {shop}")
     
     try:
-        graphql_url = f'https://{shop}/admin/api/2025-01/graphql.json'
-        headers = {
-            'Content-Type': 'application/json',
-            'X-Shopify-Access-Token': access_token
-        }
+        webhook_url = f"{REDIRECT_URI.replace('/oauth/callback', '/webhooks/subscription')}"
 
         # First, check if webhook already exists
         check_query = '''
@@ -131,20 +116,14 @@ def register_subscription_webhook(shop, access_token):
         }
         '''
 
-        response = requests.post(graphql_url, json={'query': check_query}, headers=headers)
-        
-        if response.status_code == 200:
-            result = response.json()
-            existing_webhooks = result.get('data', {}).get('webhookSubscriptions', {}).get('edges', [])
-            
-            webhook_url = f"{REDIRECT_URI.replace('/oauth/callback', '/webhooks/subscription')}"
-            
-            # Check if our webhook already exists
-            for webhook_edge in existing_webhooks:
-                webhook = webhook_edge.get('node', {})
-                if webhook.get('callbackUrl') == webhook_url:
-                    logger.info(f"Webhook already exists for {shop}: {webhook.get('id')}")
-                    return True
+        existing_webhooks = _existing_webhooks(shop, access_token, check_query)
+
+        # Check if our webhook already exists
+        for webhook_edge in existing_webhooks:
+            webhook = webhook_edge.get('node', {})
+            if webhook.get('callbackUrl') == webhook_url:
+                logger.info(f"Webhook already exists for {shop}: {webhook.get('id')}")
+                return True
 
         # Create new webhook if it doesn't exist
         mutation = '''
@@ -173,20 +152,8 @@ def register_subscription_webhook(shop, access_token):
 
         logger.info(f"Creating webhook with URL: {webhook_url}")
         
-        response = requests.post(
-            graphql_url, 
-            json={'query': mutation, 'variables': variables}, 
-            headers=headers
-        )
-
-        logger.info(f"Webhook creation response status: {response.status_code}")
-        logger.info(f"Webhook creation response: {response.text}")
-
-        if response.status_code != 200:
-            logger.error(f"Failed to create webhook: {response.text}")
-            return False
-
-        result = response.json()
+        result = shopify_client.graphql(shop, access_token, mutation, variables)
+        logger.info(f"Webhook creation response: {json.dumps(result)}")
         
         if 'errors' in result:
             logger.error(f"GraphQL errors creating webhook: {result['errors']}")
@@ -209,4 +176,70 @@ def register_subscription_webhook(shop, access_token):
 
     except Exception as e:
         logger.error(f"Exception registering webhook for {shop}: {str(e)}")
-        return False
\ No newline at end of file
+        return False
+def register_content_webhooks(shop, access_token, topics=None):
+    """Register page/article create/update/delete webhooks (CONTENT_WEBHOOK_TOPICS) pointing at
+    /webhooks/content. Topics the shop's API version does not offer are logged and skipped.
+    Returns a dict of topic -> registered."""
+    topics = topics or CONTENT_WEBHOOK_TOPICS
+    logger.info(f"Registering content webhooks for: {shop}")
+    results = {}
+
+    try:
+        webhook_url = f"{REDIRECT_URI.replace('/oauth/callback', '/webhooks/content')}"
+
+        # Topics already pointing at our URL
+        check_query = '''
+        query existingContentWebhooks($callbackUrl: URL!) {
+            webhookSubscriptions(first: 50, callbackUrl: $callbackUrl) {
+                edges {
+                    node {
+                        id
+                        topic
+                    }
+                }
+            }
+        }
+        '''
+        existing_webhooks = _existing_webhooks(shop, access_token, check_query, {'callbackUrl': webhook_url})
+        existing_topics = {edge.get('node', {}).get('topic') for edge in existing_webhooks}
+
+        mutation = '''
+        mutation webhookSubscriptionCreate($topic: WebhookSubscriptionTopic!, $webhookSubscription: WebhookSubscriptionInput!) {
+            webhookSubscriptionCreate(topic: $topic, webhookSubscription: $webhookSubscription) {
+                webhookSubscription {
+                    id
+                    topic
+                }
+                userErrors {
+                    field
+                    message
+                }
+            }
+        }
+        '''
+
+        for topic in topics:
+            if topic in existing_topics:
+                results[topic] = True
+                continue
+            variables = {
+                'topic': topic,
+                'webhookSubscription': {
+                    'callbackUrl': webhook_url,
+                    'format': 'JSON'
+                }
+            }
+            result = shopify_client.graphql(shop, access_token, mutation, variables)
+            webhook_data = (result.get('data') or {}).get('webhookSubscriptionCreate') or {}
+            if 'errors' in result or webhook_data.get('userErrors') or not webhook_data.get('webhookSubscription'):
+                logger.warning(f"Could not register {topic} webhook for {shop}: {result.get('errors') or webhook_data.get('userErrors')}")
+                results[topic] = False
+            else:
+                logger.info(f"Registered {topic} webhook for {shop}")
+                results[topic] = True
+        return results
+
+    except Exception as e:
+        logger.error(f"Exception registering content webhooks for {shop}: {str(e)}")
+        return {topic: results.get(topic, False) for topic in topics}